@@ -0,0 +1,3 @@
+"""
+Benchmarks for the portal. Run from the repository root, e.g. ``python -m benchmarks.responses``
+"""
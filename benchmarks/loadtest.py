@@ -0,0 +1,281 @@
+"""
+Load test the portal end to end against local upstream stand-ins
+
+    python -m benchmarks.loadtest [--duration S] [--processes 2] [--threads 25]
+        [--freshdesk-latency MS] [--freshdesk-errors RATE] [--config KEY=VALUE] [--json results.json]
+
+Topology, Freshdesk and hCaptcha are replaced by the servers in
+``benchmarks.upstreams``. Like mod_wsgi with ``processes=2 threads=25``, each
+worker process imports ``wsgi`` and calls ``wsgi.application`` from its own
+threads, each thread issuing requests back to back from a weighted mix of
+endpoints. Requests that start during the warm-up are not counted. The report
+gives throughput and p50/p95/p99 latency per endpoint. Portal logs go to a file
+rather than the terminal.
+
+No page reads Topology yet, so Topology is exercised by the background refresher
+(every --topology-interval seconds) and reported through /api/v1/topology/status.
+"""
+
+import argparse
+import ast
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+from .upstreams import captcha_server, freshdesk_server, topology_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TICKET = {
+    "name": "Load Test",
+    "email": "loadtest@example.org",
+    "description": "Ticket submitted by benchmarks.loadtest",
+    "subject": "PATh User - Load Test",
+    "h-captcha-response": {"value": "loadtest"},
+}
+
+# name -> (method, path, JSON body, weight)
+ENDPOINTS = {
+    "index": ("GET", "/", None, 30),
+    "application": ("GET", "/application", None, 15),
+    "credit-request": ("GET", "/credit-request", None, 10),
+    "health": ("GET", "/health", None, 10),
+    "ticket": ("POST", "/api/v1/freshdesk/ticket", TICKET, 10),
+    "topology-status": ("GET", "/api/v1/topology/status", None, 5),
+}
+
+
+def percentile(ordered, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def run_worker(index, config_path, log_path, threads, endpoints, warmup, duration, seed, ready, go, results):
+    """Body of one worker process: import the app, then hammer it from ``threads`` threads"""
+    os.environ["CONFIG_PATH"] = config_path
+    log = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    os.dup2(log, 2)
+    sys.path.insert(0, ROOT)
+
+    import wsgi
+    from werkzeug.test import EnvironBuilder
+
+    names = list(endpoints)
+    weights = [endpoints[name][3] for name in names]
+    headers = {"Accept-Encoding": "gzip, deflate, br"}
+
+    def call(name):
+        method, path, body, _ = endpoints[name]
+        builder = EnvironBuilder(path=path, method=method, json=body, headers=headers)
+        try:
+            environ = builder.get_environ()
+            status = []
+            start = time.perf_counter()
+            response = wsgi.application(environ, lambda s, h, exc_info=None: status.append(s))
+            try:
+                for _ in response:
+                    pass
+            finally:
+                if hasattr(response, "close"):
+                    response.close()
+            return start, time.perf_counter() - start, int(status[0].split()[0])
+        finally:
+            builder.close()
+
+    samples = defaultdict(list)
+    statuses = defaultdict(Counter)
+    lock = threading.Lock()
+
+    def client(n):
+        rng = random.Random(seed * 1000 + index * 100 + n)
+        local_samples = defaultdict(list)
+        local_statuses = defaultdict(Counter)
+        while True:
+            name = rng.choices(names, weights)[0]
+            start, latency, status = call(name)
+            if start >= stop_at:
+                break
+            if start >= measure_from:
+                local_samples[name].append(latency)
+                local_statuses[name][status] += 1
+        with lock:
+            for name, values in local_samples.items():
+                samples[name] += values
+                statuses[name].update(local_statuses[name])
+
+    ready.put(index)
+    go.wait()
+    measure_from = time.perf_counter() + warmup
+    stop_at = measure_from + duration
+
+    workers = [threading.Thread(target=client, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    results.put({"samples": dict(samples), "statuses": {name: dict(counts) for name, counts in statuses.items()}})
+
+
+def write_config(path, args, upstreams, tmp):
+    config = {
+        "SUPPORT_EMAIL": "support@example.org",
+        "FRESHDESK_API_URL": upstreams["freshdesk"].url,
+        "FRESHDESK_API_KEY": "loadtest",
+        # The stand-in has no plan limit to protect
+        "FRESHDESK_RATE_LIMIT": 0,
+        "H_CAPTCHA_SITEKEY": "",
+        "H_CAPTCHA_SECRET": "loadtest",
+        "H_CAPTCHA_VERIFY_URL": upstreams["captcha"].url,
+        "TOPOLOGY_URL": upstreams["topology"].url,
+        "TOPOLOGY_REFRESH_INTERVAL": args.topology_interval,
+        "TOPOLOGY_SNAPSHOT_DIR": os.path.join(tmp, "topology"),
+    }
+    if args.queue:
+        config["FRESHDESK_TICKET_QUEUE"] = os.path.join(tmp, "tickets.sqlite")
+    for item in args.config or []:
+        key, _, value = item.partition("=")
+        config[key] = ast.literal_eval(value)
+
+    with open(path, "w") as f:
+        for key, value in config.items():
+            f.write(f"{key} = {value!r}\n")
+    return config
+
+
+def summarize(results, duration):
+    samples = defaultdict(list)
+    statuses = defaultdict(Counter)
+    for result in results:
+        for name, values in result["samples"].items():
+            samples[name] += values
+        for name, counts in result["statuses"].items():
+            statuses[name].update(counts)
+
+    summary = {}
+    for name in sorted(samples, key=lambda name: -len(samples[name])):
+        ordered = sorted(samples[name])
+        summary[name] = {
+            "requests": len(ordered),
+            "throughput": len(ordered) / duration,
+            "errors": sum(count for status, count in statuses[name].items() if int(status) >= 400),
+            "statuses": {str(status): count for status, count in sorted(statuses[name].items())},
+            "p50_ms": percentile(ordered, 0.50) * 1000,
+            "p95_ms": percentile(ordered, 0.95) * 1000,
+            "p99_ms": percentile(ordered, 0.99) * 1000,
+        }
+
+    everything = sorted(value for values in samples.values() for value in values)
+    summary["total"] = {
+        "requests": len(everything),
+        "throughput": len(everything) / duration,
+        "errors": sum(entry["errors"] for entry in summary.values()),
+        "p50_ms": percentile(everything, 0.50) * 1000,
+        "p95_ms": percentile(everything, 0.95) * 1000,
+        "p99_ms": percentile(everything, 0.99) * 1000,
+    }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of load before measuring")
+    parser.add_argument("--processes", type=int, default=2, help="Worker processes (mod_wsgi processes)")
+    parser.add_argument("--threads", type=int, default=25, help="Threads per worker process (mod_wsgi threads)")
+    parser.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS),
+                        help="Only request this endpoint, may be repeated (default: the full mix)")
+    for upstream, latency in (("topology", 200), ("freshdesk", 300), ("captcha", 100)):
+        parser.add_argument(f"--{upstream}-latency", type=float, default=latency,
+                            help=f"Milliseconds the {upstream} stand-in waits before answering")
+        parser.add_argument(f"--{upstream}-errors", type=float, default=0.0,
+                            help=f"Fraction of {upstream} requests answered with an error")
+    parser.add_argument("--resources", type=int, default=1000, help="Resources in the Topology stand-in")
+    parser.add_argument("--topology-interval", type=float, default=10, help="TOPOLOGY_REFRESH_INTERVAL for the portal")
+    parser.add_argument("--queue", action="store_true", help="Submit tickets through the SQLite ticket queue")
+    parser.add_argument("--config", action="append", metavar="KEY=VALUE",
+                        help="Extra portal config, VALUE is a Python literal; may be repeated")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request mix")
+    parser.add_argument("--log", help="Keep the portal log here (default: a temporary file)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    endpoints = {name: ENDPOINTS[name] for name in args.endpoint or ENDPOINTS}
+
+    upstreams = {
+        "topology": topology_server(args.resources, latency=args.topology_latency / 1000, error_rate=args.topology_errors),
+        "freshdesk": freshdesk_server(latency=args.freshdesk_latency / 1000, error_rate=args.freshdesk_errors),
+        "captcha": captcha_server(latency=args.captcha_latency / 1000, error_rate=args.captcha_errors),
+    }
+    for server in upstreams.values():
+        server.start()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "config.py")
+        config = write_config(config_path, args, upstreams, tmp)
+        log_path = args.log or os.path.join(tmp, "portal.log")
+
+        ready, results, go = context.Queue(), context.Queue(), context.Event()
+        processes = [
+            context.Process(target=run_worker, args=(
+                i, config_path, log_path, args.threads, endpoints, args.warmup, args.duration,
+                args.seed, ready, go, results
+            ))
+            for i in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get(timeout=120)
+        go.set()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    for server in upstreams.values():
+        server.stop()
+
+    summary = summarize(collected, args.duration)
+
+    print(f"Load test: {args.processes} processes x {args.threads} threads, "
+          f"{args.duration:g}s measured after {args.warmup:g}s warm-up")
+    print(f"  {'endpoint':<18} {'requests':>9} {'req/s':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, entry in summary.items():
+        print(f"  {name:<18} {entry['requests']:>9} {entry['throughput']:>9.1f} {entry['errors']:>7} "
+              f"{entry['p50_ms']:>9.1f} {entry['p95_ms']:>9.1f} {entry['p99_ms']:>9.1f}")
+    print("\nUpstream stand-ins (requests / injected errors)")
+    for name, server in upstreams.items():
+        print(f"  {name:<18} {server.requests:>9} {server.errors:>7}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "processes": args.processes,
+                "threads": args.threads,
+                "duration": args.duration,
+                "warmup": args.warmup,
+                "upstreams": {
+                    name: {
+                        "latency_ms": server.latency * 1000,
+                        "error_rate": server.error_rate,
+                        "requests": server.requests,
+                        "errors": server.errors,
+                    }
+                    for name, server in upstreams.items()
+                },
+                "config": {key: value for key, value in config.items() if not key.endswith(("_KEY", "_SECRET"))},
+                "endpoints": summary,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
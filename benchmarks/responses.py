@@ -0,0 +1,64 @@
+"""
+Compare the API response encoder against the ``make_response(dict)`` path
+
+    python -m benchmarks.responses [--number N]
+"""
+
+import argparse
+import dataclasses
+import timeit
+
+import flask
+
+from portal.api.models.response import ErrorResponse, OkResponse, make_api_response
+
+
+def small_payload() -> OkResponse:
+    return OkResponse(status="ok", data={"job_id": "0123456789abcdef0123456789abcdef", "status": "queued"})
+
+
+def large_payload() -> OkResponse:
+    results = [
+        {"index": i, "status": "ok", "status_code": 201, "ticket": {"id": 1000 + i, "subject": "PATh User - Account Creation"}}
+        for i in range(100)
+    ]
+    return OkResponse(status="ok", data={"results": results})
+
+
+def error_payload() -> ErrorResponse:
+    return ErrorResponse(status="error", error=[
+        {"code": "missing", "message": f"field_{i} is required"} for i in range(10)
+    ])
+
+
+CANDIDATES = {
+    "make_api_response(model)": lambda body: make_api_response(body).get_data(),
+    "make_response(asdict(model))": lambda body: flask.make_response(dataclasses.asdict(body)).get_data(),
+    "make_response(dict)": None,  # The pre-serialized dict a handler used to build by hand
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    app = flask.Flask(__name__)
+
+    print(f"{'payload':<8} {'path':<32} {'us/call':>10} {'bytes':>8}")
+    with app.app_context():
+        for name, build in (("small", small_payload), ("error", error_payload), ("large", large_payload)):
+            body = build()
+            as_dict = dataclasses.asdict(body)
+            for label, encode in CANDIDATES.items():
+                if encode is None:
+                    def encode(_, as_dict=as_dict):
+                        return flask.make_response(as_dict).get_data()
+
+                size = len(encode(body))
+                seconds = min(timeit.repeat(lambda: encode(body), number=args.number, repeat=5))
+                print(f"{name:<8} {label:<32} {seconds / args.number * 1e6:>10.2f} {size:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Generate synthetic OSG Topology rgsummary XML
+
+    python -m benchmarks.rgsummary --resources 10000 [--malformed 0.02] [--seed 0] > rgsummary.xml
+
+Documents follow the shape of the real query: resource groups of a few resources
+each, resources offering one or more services, and administrative and security
+contact lists. A ``malformed`` fraction of the resources is broken in one of the
+ways the indexer has to tolerate (missing FQDN, Active flag, service name, contact
+list or CILogonID), and some resources are inactive. The same arguments always
+produce the same document.
+"""
+
+import argparse
+import random
+import sys
+from typing import List
+from xml.sax.saxutils import escape
+
+# Services seen in the real query; only the first two are indexed by the portal
+SERVICES = [
+    (109, "Submit Node"),
+    (157, "Execution Endpoint"),
+    (1, "CE"),
+    (3, "Squid"),
+    (144, "XRootD cache server"),
+    (156, "XRootD origin server"),
+]
+CONTACT_TYPES = ["Administrative Contact", "Security Contact", "Miscellaneous Contact"]
+MALFORMATIONS = ["fqdn", "active", "service_name", "contacts", "cilogon_id"]
+
+
+def cilogon_id(user: int) -> str:
+    return f"http://cilogon.org/serverA/users/{100000 + user}"
+
+
+def _contact_list(rng: random.Random, contact_type: str, users: int, malformation: str) -> str:
+    if malformation == "contacts":
+        return f"<ContactList><ContactType>{contact_type}</ContactType></ContactList>"
+
+    contacts = []
+    for rank in ("Primary", "Secondary", "Tertiary")[:rng.randint(1, 3)]:
+        user = rng.randrange(users)
+        identity = "" if malformation == "cilogon_id" else f"<CILogonID>{cilogon_id(user)}</CILogonID>"
+        contacts.append(
+            f"<Contact><Name>User {user}</Name><ContactRank>{rank}</ContactRank>{identity}</Contact>"
+        )
+    return f"<ContactList><ContactType>{contact_type}</ContactType><Contacts>{''.join(contacts)}</Contacts></ContactList>"
+
+
+def _resource(rng: random.Random, resource_id: int, users: int, malformation: str) -> str:
+    name = f"RESOURCE_{resource_id}"
+    active = "False" if rng.random() < 0.05 else "True"
+
+    services = []
+    for service_id, service in rng.sample(SERVICES[:2], 1) + rng.sample(SERVICES[2:], rng.randint(0, 2)):
+        service_name = "" if malformation == "service_name" else f"<Name>{escape(service)}</Name>"
+        services.append(
+            f"<Service><ID>{service_id}</ID>{service_name}<Description>{escape(service)} for {name}</Description>"
+            "<Details><hidden>False</hidden></Details></Service>"
+        )
+
+    contact_lists = [
+        _contact_list(rng, contact_type, users, malformation if contact_type == CONTACT_TYPES[0] else None)
+        for contact_type in CONTACT_TYPES[:rng.randint(1, 3)]
+    ]
+
+    return "".join([
+        f"<Resource><ID>{resource_id}</ID><Name>{name}</Name>",
+        "" if malformation == "active" else f"<Active>{active}</Active>",
+        f"<Disable>False</Disable><Services>{''.join(services)}</Services><Tags/>",
+        f"<Description>Synthetic resource {resource_id}</Description>",
+        "" if malformation == "fqdn" else f"<FQDN>host{resource_id}.site{resource_id // 7}.example.org</FQDN>",
+        "<FQDNAliases/><VOOwnership><Ownership><Percent>100</Percent><VO>OSG</VO></Ownership></VOOwnership>",
+        "<WLCGInformation><InteropBDII>False</InteropBDII><InteropMonitoring>False</InteropMonitoring>"
+        "<InteropAccounting>False</InteropAccounting></WLCGInformation>",
+        f"<ContactLists>{''.join(contact_lists)}</ContactLists></Resource>",
+    ])
+
+
+def generate(resources: int, malformed: float = 0.02, seed: int = 0, users: int = None) -> bytes:
+    """
+    Return an rgsummary document with ``resources`` resources administered by
+    ``users`` distinct CILogonIDs (by default one per five resources)
+    """
+    rng = random.Random(seed)
+    users = users or max(resources // 5, 1)
+
+    groups: List[str] = []
+    resource_id = 0
+    while resource_id < resources:
+        group_id = len(groups)
+        members = []
+        for _ in range(min(rng.randint(1, 8), resources - resource_id)):
+            malformation = rng.choice(MALFORMATIONS) if rng.random() < malformed else None
+            members.append(_resource(rng, resource_id, users, malformation))
+            resource_id += 1
+        groups.append(
+            f"<ResourceGroup><GroupName>GROUP_{group_id}</GroupName><GroupID>{group_id}</GroupID>"
+            f"<Facility><Name>Facility {group_id // 3}</Name><ID>{group_id // 3}</ID></Facility>"
+            f"<Site><Name>Site {group_id // 2}</Name><ID>{group_id // 2}</ID></Site>"
+            "<SupportCenter><Name>Self Supported</Name><ID>1</ID></SupportCenter>"
+            f"<GroupDescription>Synthetic resource group {group_id}</GroupDescription>"
+            f"<Resources>{''.join(members)}</Resources></ResourceGroup>"
+        )
+
+    return ("<?xml version='1.0' encoding='utf-8'?>\n<ResourceSummary>" + "".join(groups) + "</ResourceSummary>").encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resources", type=int, default=1000, help="Resources in the document")
+    parser.add_argument("--malformed", type=float, default=0.02, help="Fraction of malformed resources")
+    parser.add_argument("--users", type=int, help="Distinct CILogonIDs (default: resources / 5)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the document")
+    args = parser.parse_args()
+
+    sys.stdout.buffer.write(generate(args.resources, args.malformed, args.seed, args.users))
+
+
+if __name__ == "__main__":
+    main()
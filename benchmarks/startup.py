@@ -0,0 +1,149 @@
+"""
+Measure where a fresh WSGI process spends its start-up time
+
+    python -m benchmarks.startup [--runs N] [--warmup] [--path /] [--json results.json]
+
+Each run starts a new interpreter that imports ``portal``, imports ``wsgi`` (which
+runs ``create_app``) and then calls ``wsgi.application`` directly for every path,
+so the numbers include everything a restarted mod_wsgi daemon process pays before
+its first response. The import profile comes from ``python -X importtime``.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """
+SUPPORT_EMAIL = "support@example.org"
+FRESHDESK_API_URL = "http://127.0.0.1:9"
+FRESHDESK_API_KEY = ""
+H_CAPTCHA_SITEKEY = ""
+H_CAPTCHA_SECRET = "benchmark"
+TOPOLOGY_REFRESH_INTERVAL = 0
+PORTAL_WARMUP = {warmup}
+"""
+
+CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import portal
+t1 = time.perf_counter()
+import wsgi
+t2 = time.perf_counter()
+
+from werkzeug.test import EnvironBuilder
+
+def request(path):
+    start = time.perf_counter()
+    status = []
+    body = wsgi.application(EnvironBuilder(path=path).get_environ(), lambda s, h, e=None: status.append(s))
+    b"".join(body)
+    if hasattr(body, "close"):
+        body.close()
+    return (time.perf_counter() - start) * 1000, status[0]
+
+paths = json.loads(sys.argv[1])
+first = {path: request(path) for path in paths}
+first_response_at = time.time()
+second = {path: request(path) for path in paths}
+print(json.dumps({
+    "import_portal_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_response_at": first_response_at,
+    "first": first,
+    "second": second,
+}))
+"""
+
+
+def python_startup_ms() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def run_once(env, paths):
+    spawned_at = time.time()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps(paths)],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    )
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    data["time_to_first_response_ms"] = (data.pop("first_response_at") - spawned_at) * 1000
+    return data
+
+
+def import_profile(env, top):
+    """Return the ``top`` modules by cumulative import time as (module, self_us, cumulative_us)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import portal"],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="Fresh processes to measure")
+    parser.add_argument("--warmup", action="store_true", help="Enable PORTAL_WARMUP in the measured app")
+    parser.add_argument("--path", action="append", help="Path to request, may be repeated (default: / and /application)")
+    parser.add_argument("--top", type=int, default=15, help="Modules to show in the import profile")
+    parser.add_argument("--json", help="Also write the raw results to this file")
+    args = parser.parse_args()
+    paths = args.path or ["/", "/application"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "config.py")
+        with open(config_path, "w") as f:
+            f.write(CONFIG.format(warmup=args.warmup))
+
+        env = {**os.environ, "CONFIG_PATH": config_path, "PYTHONDONTWRITEBYTECODE": "1"}
+        subprocess.run([sys.executable, "-c", "import wsgi"], cwd=ROOT, env=env, check=True, capture_output=True)
+
+        interpreter = [python_startup_ms() for _ in range(args.runs)]
+        runs = [run_once(env, paths) for _ in range(args.runs)]
+        profile = import_profile(env, args.top)
+
+    def median(values):
+        return statistics.median(values)
+
+    print(f"Start-up over {args.runs} fresh processes (median, warm-up {'on' if args.warmup else 'off'})")
+    print(f"  {'interpreter start-up':<32} {median(interpreter):>9.1f} ms")
+    print(f"  {'import portal':<32} {median([r['import_portal_ms'] for r in runs]):>9.1f} ms")
+    print(f"  {'import wsgi (create_app)':<32} {median([r['create_app_ms'] for r in runs]):>9.1f} ms")
+    for path in paths:
+        print(f"  {'first response ' + path:<32} {median([r['first'][path][0] for r in runs]):>9.1f} ms")
+        print(f"  {'second response ' + path:<32} {median([r['second'][path][0] for r in runs]):>9.1f} ms")
+    print(f"  {'time to first response':<32} {median([r['time_to_first_response_ms'] for r in runs]):>9.1f} ms")
+
+    print(f"\nSlowest imports of portal (cumulative)")
+    for module, self_us, cumulative_us in profile:
+        print(f"  {module:<40} {cumulative_us / 1000:>8.1f} ms  (self {self_us / 1000:.1f} ms)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "warmup": args.warmup,
+                "paths": paths,
+                "interpreter_ms": interpreter,
+                "runs": runs,
+                "import_profile": profile,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
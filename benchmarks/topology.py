@@ -0,0 +1,185 @@
+"""
+Measure Topology parsing, source lookups and parser memory at increasing document sizes
+
+    python -m benchmarks.topology [--sizes 100,1000,10000,100000] [--repeat 3]
+        [--json results.json] [--compare baseline.json [--threshold 0.1]]
+
+Every size gets a synthetic document from ``benchmarks.rgsummary``. The benchmark then
+measures:
+
+- the time ``index_topology`` takes to parse the document from memory;
+- the time per ``get_sources`` call against a cache holding that index;
+- the peak memory ``tracemalloc`` sees while parsing, and the size of the index.
+
+Everything runs offline. Documents are seeded, so results from different runs and
+commits can be compared. ``--compare`` reports every metric relative to an earlier
+``--json`` file and exits non-zero when one regressed by more than ``--threshold``.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from portal.app import create_app
+from portal.sources import get_sources, index_topology, topology_cache
+
+from .rgsummary import cilogon_id, generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URL = "benchmark://topology"
+
+CONFIG = {
+    "SUPPORT_EMAIL": "support@example.org",
+    "FRESHDESK_API_URL": "http://127.0.0.1:9",
+    "FRESHDESK_API_KEY": "",
+    "H_CAPTCHA_SITEKEY": "",
+    "H_CAPTCHA_SECRET": "benchmark",
+    "TOPOLOGY_URL": URL,
+    "TOPOLOGY_REFRESH_INTERVAL": 0,
+}
+
+# Metrics checked by --compare, lower is better for all of them
+COMPARED = ("parse_min_s", "lookup_us", "peak_bytes")
+
+
+def measure_parse(document: bytes, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        index = index_topology(io.BytesIO(document))
+        times.append(time.perf_counter() - start)
+    return index, times
+
+
+def measure_memory(document: bytes):
+    tracemalloc.start()
+    try:
+        index = index_topology(io.BytesIO(document))
+        index_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del index
+    return peak_bytes, index_bytes
+
+
+def measure_lookups(app, index, users: int, lookups: int, seed: int) -> float:
+    rng = random.Random(seed)
+    user_infos = [{"id": cilogon_id(rng.randrange(users))} for _ in range(lookups)]
+    topology_cache.prime(URL, index)
+
+    # Best of several rounds, lookups are short enough for scheduling noise to show
+    rounds = []
+    with app.app_context():
+        for _ in range(5):
+            start = time.perf_counter()
+            for user_info in user_infos:
+                get_sources(user_info, "Submit Node")
+            rounds.append(time.perf_counter() - start)
+
+    topology_cache.invalidate(URL)
+    return min(rounds) / lookups * 1e6
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold: float) -> bool:
+    """Print each metric relative to ``baseline`` and return True if any regressed"""
+    regressed = False
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} (threshold {threshold:.0%})")
+    for size, entry in results.items():
+        before = baseline["results"].get(size)
+        if before is None:
+            continue
+        if before["index_users"] != entry["index_users"]:
+            print(f"  {size:>7}  index differs: {before['index_users']} -> {entry['index_users']} users")
+            regressed = True
+        for metric in COMPARED:
+            if not before.get(metric):
+                continue
+            ratio = entry[metric] / before[metric]
+            worse = ratio > 1 + threshold
+            regressed |= worse
+            print(f"  {size:>7}  {metric:<12} {ratio:>6.2f}x{'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="Comma-separated resource counts")
+    parser.add_argument("--repeat", type=int, default=3, help="Parses timed per size")
+    parser.add_argument("--lookups", type=int, default=10000, help="get_sources calls timed per size")
+    parser.add_argument("--malformed", type=float, default=0.02, help="Fraction of malformed resources")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the documents and lookups")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    app = create_app(CONFIG)
+    results = {}
+
+    print(f"{'resources':>9} {'XML MB':>8} {'users':>7} {'parse ms':>10} {'min ms':>10} "
+          f"{'lookup us':>10} {'peak MB':>9} {'index MB':>9}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        document = generate(size, args.malformed, args.seed)
+        users = max(size // 5, 1)
+
+        index, times = measure_parse(document, args.repeat)
+        peak_bytes, index_bytes = measure_memory(document)
+        lookup_us = measure_lookups(app, index, users, args.lookups, args.seed)
+
+        entry = results[str(size)] = {
+            "document_bytes": len(document),
+            "index_users": len(index),
+            "index_fqdns": sum(len(fqdns) for services in index.values() for fqdns in services.values()),
+            "parse_s": times,
+            "parse_median_s": statistics.median(times),
+            "parse_min_s": min(times),
+            "lookup_us": lookup_us,
+            "peak_bytes": peak_bytes,
+            "index_bytes": index_bytes,
+        }
+        print(f"{size:>9} {len(document) / 1e6:>8.1f} {len(index):>7} {entry['parse_median_s'] * 1000:>10.1f} "
+              f"{entry['parse_min_s'] * 1000:>10.1f} {lookup_us:>10.2f} {peak_bytes / 1e6:>9.1f} {index_bytes / 1e6:>9.1f}")
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "seed": args.seed,
+            "malformed": args.malformed,
+            "repeat": args.repeat,
+            "lookups": args.lookups,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Local stand-ins for the services the portal calls: OSG Topology rgsummary XML, the
+Freshdesk tickets API and hCaptcha siteverify
+
+Every server delays each response by ``latency`` seconds and answers a random
+``error_rate`` fraction of requests with an error status, so load tests can see
+how the portal behaves when an upstream is slow or failing.
+"""
+
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from typing import Optional
+
+from .rgsummary import generate
+
+
+class UpstreamHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+
+    error_status = 503
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, body: bytes, content_type: str = "application/json", **headers) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def inject(self) -> bool:
+        """Apply the configured latency and return True if this request should fail"""
+        self.server.count()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self.server.count_error()
+            self.reply(self.error_status, b'{"error": "injected"}')
+            return True
+        return False
+
+
+class TopologyHandler(UpstreamHandler):
+    error_status = 500
+
+    def do_GET(self):
+        if self.inject():
+            return
+        etag = self.server.etag
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.reply(200, self.server.document, content_type="text/xml", ETag=etag)
+
+
+class FreshdeskHandler(UpstreamHandler):
+    tickets_path = "/api/v2/tickets"
+
+    def do_POST(self):
+        ticket = json.loads(self.read_body() or b"{}")
+        # Only the route the portal uses in production, so a wrong URL shows up as errors
+        if self.path != self.tickets_path:
+            self.reply(404, b'{"code": "invalid_url"}')
+            return
+        if self.inject():
+            return
+        self.reply(201, json.dumps({"id": self.server.count_ticket(), "subject": ticket.get("subject")}).encode())
+
+
+class CaptchaHandler(UpstreamHandler):
+    error_status = 500
+
+    def do_POST(self):
+        form = urllib.parse.parse_qs(self.read_body().decode())
+        if self.inject():
+            return
+        self.reply(200, json.dumps({"success": form.get("response") != ["fail"]}).encode())
+
+
+class UpstreamServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, handler, latency: float = 0.0, error_rate: float = 0.0, path: str = "/"):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.path = path
+
+        self.requests = 0
+        self.errors = 0
+        self._tickets = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}{self.path}"
+
+    def handle_error(self, request, client_address):
+        # Worker processes exit with requests in flight; a dropped connection is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def count_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def count_ticket(self) -> int:
+        with self._lock:
+            self._tickets += 1
+            return self._tickets
+
+    def start(self) -> "UpstreamServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def topology_server(resources: int = 1000, **kwargs) -> UpstreamServer:
+    server = UpstreamServer(TopologyHandler, path="/rgsummary/xml?service=on&service_109=on&service_157=on", **kwargs)
+    server.document = generate(resources)
+    server.etag = f'"{len(server.document)}"'
+    return server
+
+
+def freshdesk_server(**kwargs) -> UpstreamServer:
+    # The portal appends /api/v2/tickets to FRESHDESK_API_URL itself
+    return UpstreamServer(FreshdeskHandler, path="", **kwargs)
+
+
+def captcha_server(**kwargs) -> UpstreamServer:
+    return UpstreamServer(CaptchaHandler, path="/siteverify", **kwargs)
@@ -1,14 +1,24 @@
 import json
 import logging
-import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
 from flask import (
     Blueprint,
     current_app,
-    request,
-    make_response
+    url_for
 )
 
-from portal.website.util import verify_captcha
+from portal.metrics import track_upstream
+from portal.website.util import admin_required, verify_captcha
+from .models.request import Field, Schema, validate_json
+from .models.response import ErrorResponse, OkResponse, make_api_response
+
+if TYPE_CHECKING:
+    # Imported on first use, most processes serve many pages before their first ticket
+    import requests
 
 freshdesk_api_bp = Blueprint(
     "freshdesk_api",
@@ -16,27 +26,164 @@ freshdesk_api_bp = Blueprint(
     url_prefix="/freshdesk"
 )
 
+DEFAULT_POOL_SIZE = 25  # Matches the mod_wsgi threads per process
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Statuses that mean Freshdesk did not process a request, when sent with Retry-After
+POST_RETRY_STATUSES = frozenset([429, 503])
+DEFAULT_BULK_CONCURRENCY = 4
+DEFAULT_BULK_MAX_TICKETS = 100
+DEFAULT_RATE_LIMIT = 100  # Ticket POSTs per minute across all processes, the lowest Freshdesk plan limit
+
+TICKET_FIELDS = (
+    Field("name", str, min_length=1, max_length=255),
+    Field("email", str, max_length=254, pattern=r"^[^@\s]+@[^@\s]+$"),
+    Field("description", str, min_length=1, max_length=1_000_000),
+    Field("subject", str, required=False, max_length=255),
+)
+TICKET_SCHEMA = Schema(*TICKET_FIELDS)
+CAPTCHA_TICKET_SCHEMA = Schema(
+    Field("h-captcha-response", dict, fields=(Field("value", str, min_length=1),)),
+    *TICKET_FIELDS
+)
+BULK_TICKET_SCHEMA = Schema(Field("tickets", list, min_length=1))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing ``rate`` calls per minute with bursts of up to ``burst``
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate / 60
+        self.burst = burst
+
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a call is allowed"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+
+            # Reserve a token even if it has not accrued yet, later callers queue up behind it
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+
+
+def _process_count(config) -> int:
+    """Processes sharing the Freshdesk budget: FRESHDESK_PROCESSES, else mod_wsgi's process count"""
+    processes = config.get("FRESHDESK_PROCESSES")
+    if processes is None:
+        try:
+            import mod_wsgi
+            processes = mod_wsgi.maximum_processes
+        except (ImportError, AttributeError):
+            processes = 1
+    return max(int(processes), 1)
+
+
+def get_rate_limiter(app) -> Optional[RateLimiter]:
+    """
+    Return the app's limiter for ticket POSTs, or None if FRESHDESK_RATE_LIMIT is 0
+
+    Each process keeps its own bucket, so FRESHDESK_RATE_LIMIT is split evenly
+    between the processes serving the app.
+    """
+    with _session_lock:
+        if "freshdesk_rate_limiter" not in app.extensions:
+            rate = app.config.get("FRESHDESK_RATE_LIMIT", DEFAULT_RATE_LIMIT)
+            app.extensions["freshdesk_rate_limiter"] = RateLimiter(
+                rate / _process_count(app.config),
+                burst=app.config.get("FRESHDESK_BULK_CONCURRENCY", DEFAULT_BULK_CONCURRENCY)
+            ) if rate else None
+
+        return app.extensions["freshdesk_rate_limiter"]
+
+
+def get_session(config) -> "requests.Session":
+    """
+    Return the process-wide Freshdesk session, creating it on first use.
+
+    The session keeps up to FRESHDESK_POOL_SIZE keep-alive connections so tickets
+    reuse TLS connections. Up to FRESHDESK_RETRIES retries back off exponentially,
+    honouring any Retry-After header:
+
+    - connection failures are always retried, the request never reached Freshdesk;
+    - GET, PUT and DELETE are also retried after read errors and 429/5xx responses;
+    - POST, which creates tickets, is only retried on a 429 or 503 that carries
+      Retry-After. A POST that timed out or got another error may already have
+      created its ticket, so it is never sent again.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            class FreshdeskRetry(Retry):
+
+                def is_retry(self, method, status_code, has_retry_after=False):
+                    if method.upper() == "POST":
+                        return bool(self.total) and has_retry_after and status_code in POST_RETRY_STATUSES
+                    return super().is_retry(method, status_code, has_retry_after)
+
+            retry = FreshdeskRetry(
+                total=config.get("FRESHDESK_RETRIES", DEFAULT_RETRIES),
+                other=0,
+                backoff_factor=config.get("FRESHDESK_RETRY_BACKOFF", DEFAULT_RETRY_BACKOFF),
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(["GET", "PUT", "DELETE"]),
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            pool_size = config.get("FRESHDESK_POOL_SIZE", DEFAULT_POOL_SIZE)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+
+        return _session
+
+
 class FreshDeskAPI:
     """
     Minimal wrapper for FreshDesk's API. ( Copied from HARBORAPI )
 
-    All calls will be made using the credentials provided to the constructor.
+    All calls will be made using the credentials from the app config, over the
+    process-wide pooled session. Ticket creation waits on the app's rate limiter.
     """
 
-    def __init__(self):
+    def __init__(self, session: "requests.Session" = None, rate_limiter: RateLimiter = None):
 
-        self.session = requests.Session()
+        self.session = session or get_session(current_app.config)
+        self.rate_limiter = rate_limiter or get_rate_limiter(current_app._get_current_object())
 
         self.base_url = current_app.config["FRESHDESK_API_URL"]
         self.api_key = current_app.config["FRESHDESK_API_KEY"]
+        self.timeout = (
+            current_app.config.get("FRESHDESK_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+            current_app.config.get("FRESHDESK_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)
+        )
 
         self.log = logging.getLogger(__name__)
 
-    def _renew_session(self):
-        if self.session:
-            self.session.close()
-        self.session = requests.Session()
-
     def _request(self, method, url, **kwargs):
         """
         Logs and sends an HTTP request.
@@ -46,17 +193,26 @@ class FreshDeskAPI:
         indicating failure, the response is still returned. Other failures
         result in an exception being raised.
         """
+        import requests
+
         if self.api_key:
             if "auth" not in kwargs:
                 kwargs["auth"] = (self.api_key, "X")
+        kwargs.setdefault("timeout", self.timeout)
 
-        self.log.info("%s %s %s", method.upper(), url, kwargs)
+        self.log.info("%s %s", method.upper(), url)
+        if self.log.isEnabledFor(logging.DEBUG):
+            # Ticket bodies are large and personal, only log them when debugging
+            self.log.debug("%s %s %s", method.upper(), url, {k: v for k, v in kwargs.items() if k != "auth"})
 
-        try:
-            r = self.session.request(method, url, **kwargs)
-        except requests.RequestException as exn:
-            self.log.exception(exn)
-            raise
+        with track_upstream("freshdesk") as call:
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except requests.RequestException as exn:
+                self.log.exception(exn)
+                raise
+            if not r.ok:
+                call.outcome = "error"
 
         try:
             r.raise_for_status()
@@ -69,8 +225,6 @@ class FreshDeskAPI:
         """
         Logs and sends an HTTP POST request for the given route.
         """
-        self._renew_session()
-
         return self._request("POST", f"{self.base_url}{route}", **kwargs)
 
     def create_ticket(
@@ -84,7 +238,7 @@ class FreshDeskAPI:
             status: int,
             type: str,
             **kwargs
-    ) -> requests.Response:
+    ) -> "requests.Response":
         """
         Create a ticket
         """
@@ -102,6 +256,8 @@ class FreshDeskAPI:
 
         headers = {"Content-Type": "application/json"}
 
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
         return self._post(f"/api/v2/tickets", data=data, headers=headers)
 
     def create_path_ticket(
@@ -125,16 +281,137 @@ class FreshDeskAPI:
 
         return self.create_ticket(**ticket_data)
 
+    def create_tickets(
+            self,
+            tickets: Iterable[Dict],
+            concurrency: int = DEFAULT_BULK_CONCURRENCY
+    ) -> List[Dict]:
+        """
+        Create a batch of PATh tickets
+
+        Tickets are validated up front and the valid ones are sent ``concurrency`` at a
+        time over the pooled session, pausing as needed to stay under the rate limit.
+        Returns one result per ticket, in input order.
+        """
+        import requests
+
+        tickets = list(tickets)
+        results = [None] * len(tickets)
+
+        valid = []
+        for i, ticket in enumerate(tickets):
+            tickets[i], errors = TICKET_SCHEMA.validate(ticket)
+            if errors:
+                results[i] = {"index": i, "status": "error", "error": errors}
+            else:
+                valid.append(i)
+
+        def send(i):
+            try:
+                response = self.create_path_ticket(**tickets[i])
+            except requests.RequestException as e:
+                return {"index": i, "status": "error", "error": str(e)}
+
+            try:
+                body = response.json()
+            except ValueError:
+                body = response.text
+
+            if not response.ok:
+                return {"index": i, "status": "error", "status_code": response.status_code, "error": body}
+            return {"index": i, "status": "ok", "status_code": response.status_code, "ticket": body}
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            for i, result in zip(valid, executor.map(send, valid)):
+                results[i] = result
+
+        return results
+
+
+@freshdesk_api_bp.route("/tickets", methods=["POST"])
+@admin_required
+@validate_json(BULK_TICKET_SCHEMA)
+def create_tickets(payload):
+    """Endpoint for administrators to create a batch of tickets in Freshdesk"""
+
+    tickets = payload["tickets"]
+    max_tickets = current_app.config.get("FRESHDESK_BULK_MAX_TICKETS", DEFAULT_BULK_MAX_TICKETS)
+    if len(tickets) > max_tickets:
+        return make_api_response(ErrorResponse(status="error", error=[{
+            "code": "too_many_tickets",
+            "message": f"At most {max_tickets} tickets can be created at once"
+        }]), 413)
+
+    results = FreshDeskAPI().create_tickets(
+        tickets,
+        concurrency=current_app.config.get("FRESHDESK_BULK_CONCURRENCY", DEFAULT_BULK_CONCURRENCY)
+    )
+
+    return make_api_response(OkResponse(status="ok", data={'results': results}), 200)
+
 
 @freshdesk_api_bp.route("/ticket", methods=["POST"])
-def create_ticket():
+@validate_json(CAPTCHA_TICKET_SCHEMA)
+def create_ticket(payload):
     """Endpoint for creating a ticket in Freshdesk"""
 
-    if not verify_captcha(request.json['h-captcha-response']["value"]):
-        return make_response({'error': "You did not complete the h_captcha"}, 403)
+    if not verify_captcha(payload.pop('h-captcha-response')["value"]):
+        return make_api_response(ErrorResponse(status="error", error=[{
+            "code": "captcha_failed",
+            "message": "You did not complete the h_captcha"
+        }]), 403)
 
-    response = FreshDeskAPI().create_path_ticket(
-        **request.json
-    )
+    queue = current_app.extensions.get("ticket_queue")
+    if queue is not None:
+        job_id = queue.submit(payload)
+        response = make_api_response(OkResponse(status="ok", data={'job_id': job_id, 'status': "queued"}), 202)
+        response.headers["Location"] = url_for(".ticket_status", job_id=job_id)
+        return response
+
+    import requests
+
+    try:
+        response = FreshDeskAPI().create_path_ticket(**payload)
+    except requests.Timeout as e:
+        current_app.logger.warning("Creating a ticket timed out: %s", e)
+        return make_api_response(ErrorResponse(status="error", error=[{
+            "code": "upstream_timeout",
+            "message": "Freshdesk did not respond in time, the ticket may not have been created"
+        }]), 504)
+    except requests.RequestException as e:
+        current_app.logger.warning("Creating a ticket failed: %s", e)
+        return make_api_response(ErrorResponse(status="error", error=[{
+            "code": "upstream_error",
+            "message": "Freshdesk could not be reached, please try again later"
+        }]), 502)
+
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+
+    if not response.ok:
+        return make_api_response(ErrorResponse(status="error", error=body), response.status_code)
+
+    return make_api_response(OkResponse(status="ok", data=body), response.status_code)
+
+
+@freshdesk_api_bp.route("/ticket/<job_id>", methods=["GET"])
+def ticket_status(job_id):
+    """Endpoint reporting the outcome of a ticket submitted in asynchronous mode"""
+
+    queue = current_app.extensions.get("ticket_queue")
+    if queue is None:
+        return make_api_response(ErrorResponse(status="error", error=[{
+            "code": "not_enabled",
+            "message": "Asynchronous ticket submission is not enabled"
+        }]), 404)
+
+    status = queue.status(job_id)
+    if status is None:
+        return make_api_response(ErrorResponse(status="error", error=[{
+            "code": "not_found",
+            "message": f"No ticket submission with ID {job_id}"
+        }]), 404)
 
-    return make_response(response.json(), response.status_code)
+    return make_api_response(OkResponse(status="ok", data=status), 200)
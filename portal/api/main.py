@@ -3,6 +3,7 @@ from flask import (
 )
 
 from .freshdesk import freshdesk_api_bp
+from .topology import topology_api_bp
 
 api_bp = Blueprint(
     "api",
@@ -11,4 +12,5 @@ api_bp = Blueprint(
 )
 
 api_bp.register_blueprint(freshdesk_api_bp)
+api_bp.register_blueprint(topology_api_bp)
 
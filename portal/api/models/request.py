@@ -0,0 +1,127 @@
+"""
+Request Models for the API
+
+Schemas are declared once at import time and compiled into a flat list of checks,
+so a malformed payload is rejected in-process before any outbound call is made.
+"""
+
+import dataclasses
+import re
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import flask
+
+from .response import ErrorResponse, make_api_response
+
+Errors = List[Dict[str, str]]
+
+
+@dataclasses.dataclass(frozen=True)
+class Field:
+    name: str
+    type: Union[type, Tuple[type, ...]]
+    required: bool = True
+    min_length: Optional[int] = None
+    max_length: Optional[int] = None
+    pattern: Optional[str] = None
+    fields: Tuple["Field", ...] = ()
+
+
+def _error(code: str, message: str) -> Dict[str, str]:
+    return {"code": code, "message": message}
+
+
+def _compile(field: Field, path: str) -> Callable[[Dict, Dict, Errors], None]:
+    """Compile a field into a closure that checks it and copies it into the output"""
+    name = field.name
+    types = field.type
+    regex = re.compile(field.pattern) if field.pattern else None
+    children = [_compile(child, f"{path}.{child.name}") for child in field.fields]
+    check_length = field.min_length is not None or field.max_length is not None
+    min_length = field.min_length or 0
+    max_length = field.max_length
+    unit = "characters" if types is str else "items"
+
+    def check(container: Dict, out: Dict, errors: Errors) -> None:
+        value = container.get(name)
+        if value is None:
+            if field.required:
+                errors.append(_error("missing", f"{path} is required"))
+            return
+
+        # bool is an int, but never a valid one
+        if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+            errors.append(_error("invalid_type", f"{path} has the wrong type"))
+            return
+
+        if check_length:
+            if len(value) < min_length:
+                errors.append(_error("too_short", f"{path} must have at least {min_length} {unit}"))
+                return
+            if max_length is not None and len(value) > max_length:
+                errors.append(_error("too_long", f"{path} must have at most {max_length} {unit}"))
+                return
+
+        if regex is not None and not regex.match(value):
+            errors.append(_error("invalid_format", f"{path} is not formatted correctly"))
+            return
+
+        if children:
+            value_out = {}
+            for child in children:
+                child(value, value_out, errors)
+            value = value_out
+
+        out[name] = value
+
+    return check
+
+
+class Schema:
+    """
+    Declarative JSON object schema
+
+    ``validate`` returns the declared fields of the payload and a list of
+    ``{"code", "message"}`` errors; undeclared fields are dropped.
+    """
+
+    def __init__(self, *fields: Field):
+        self.fields = fields
+        self._checks = [_compile(field, field.name) for field in fields]
+
+    def validate(self, payload: Any) -> Tuple[Dict, Errors]:
+        if not isinstance(payload, dict):
+            return {}, [_error("invalid_type", "Request body must be a JSON object")]
+
+        data, errors = {}, []
+        for check in self._checks:
+            check(payload, data, errors)
+
+        return data, errors
+
+
+def validate_json(schema: Schema):
+    """
+    Validate a view's JSON body against ``schema`` and pass the result as ``payload``,
+    responding with a 400 ErrorResponse instead of calling the view if it is invalid
+    """
+
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            payload = flask.request.get_json(silent=True)
+            if payload is None:
+                errors = [_error("invalid_json", "Request body must be JSON")]
+            else:
+                payload, errors = schema.validate(payload)
+
+            if errors:
+                return make_api_response(ErrorResponse(status="error", error=errors), 400)
+
+            return view(*args, payload=payload, **kwargs)
+
+        return wrapper
+
+    return decorator
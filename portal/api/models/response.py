@@ -3,10 +3,10 @@ Response Models for the API
 """
 
 import dataclasses
-from typing import Any, Dict, List, Optional, Union
+import json
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 
 import flask
-from typing_extensions import Literal
 
 
 @dataclasses.dataclass
@@ -31,3 +31,35 @@ class OkResponse(BaseResponse):
 class ErrorResponse(BaseResponse):
     error: Union[Any, List[Dict[Literal["code", "message"], str]]]
 
+
+_FIELD_NAMES: Dict[type, Tuple[str, ...]] = {}
+
+
+def _encode_dataclass(value: Any) -> Dict[str, Any]:
+    """
+    ``default`` hook for the JSON encoder: turn a dataclass into a shallow dict
+
+    Field names are looked up once per class, and nested values are left to the
+    encoder's own recursion instead of being deep-copied like ``dataclasses.asdict``.
+    """
+    cls = type(value)
+    names = _FIELD_NAMES.get(cls)
+    if names is None:
+        if not dataclasses.is_dataclass(cls):
+            raise TypeError(f"Object of type {cls.__name__} is not JSON serializable")
+        names = _FIELD_NAMES[cls] = tuple(field.name for field in dataclasses.fields(cls))
+
+    return {name: getattr(value, name) for name in names}
+
+
+_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_encode_dataclass)
+
+
+def encode_response(body: BaseResponse) -> bytes:
+    """Serialize a response model to compact UTF-8 JSON"""
+    return _encoder.encode(body).encode("utf-8")
+
+
+def make_api_response(body: BaseResponse, status_code: int = 200) -> flask.Response:
+    """Serialize a response model into a JSON response"""
+    return flask.Response(encode_response(body), status=status_code, mimetype="application/json")
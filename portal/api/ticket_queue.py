@@ -0,0 +1,283 @@
+"""
+Durable queue of Freshdesk ticket submissions.
+
+Tickets are written to a local SQLite database and a pool of worker threads
+drains it to Freshdesk, so a submission only waits on a local write and tickets
+survive Freshdesk outages and process restarts. Every mod_wsgi process may run
+workers against the same database; jobs are claimed inside an immediate
+transaction so each one is only sent by a single worker.
+
+A ticket is only sent again when Freshdesk provably never received it: the
+connection could not be made, or Freshdesk answered 429/503. A timeout or dropped
+connection after the ticket was sent, or a worker dying mid-send, leaves the
+ticket "unknown" for an administrator to reconcile, since sending it again could
+create a duplicate.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from .freshdesk import POST_RETRY_STATUSES, FreshDeskAPI
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_RETRY_DELAY = 30
+MAX_RETRY_DELAY = 3600
+POLL_INTERVAL = 5
+LEASE_TIMEOUT = 600  # Jobs claimed longer ago than this were orphaned by a worker that died mid-send
+
+QUEUED, SENDING, SENT, FAILED, UNKNOWN = "queued", "sending", "sent", "failed", "unknown"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    response_code INTEGER,
+    response TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tickets_ready ON tickets (status, next_attempt);
+"""
+
+
+class TicketQueue:
+    """
+    SQLite-backed ticket queue drained to ``FreshDeskAPI.create_path_ticket``
+    """
+
+    def __init__(
+            self,
+            app,
+            path: str,
+            workers: int = DEFAULT_WORKERS,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+            retry_delay: float = DEFAULT_RETRY_DELAY
+    ):
+        self.app = app
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self.log = logging.getLogger(__name__)
+
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection to the queue database"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def submit(self, payload: Dict) -> str:
+        """Durably queue a ticket and return its job ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO tickets (id, payload, status, next_attempt, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, json.dumps(payload), QUEUED, now, now, now)
+        )
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """Return the outcome of a queued ticket, or None if the job ID is unknown"""
+        row = self._connection().execute(
+            "SELECT id, status, attempts, created, updated, response_code, response, error FROM tickets WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "created": row["created"],
+            "updated": row["updated"],
+            "response_code": row["response_code"],
+            "ticket": json.loads(row["response"]) if row["status"] == SENT and row["response"] else None,
+            "error": row["error"]
+        }
+
+    def start(self) -> None:
+        self._stopped.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ticket-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Mark the next ready job as being sent and return it"""
+        connection = self._connection()
+        now = time.time()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # The dead worker may have sent the ticket, so it isn't sent again
+            orphaned = connection.execute(
+                "UPDATE tickets SET status = ?, updated = ?, error = ? WHERE status = ? AND updated <= ?",
+                (UNKNOWN, now, "The worker sending this ticket stopped; it may or may not have been created",
+                 SENDING, now - LEASE_TIMEOUT)
+            ).rowcount
+            row = connection.execute(
+                "SELECT id, payload, attempts FROM tickets WHERE status = ? AND next_attempt <= ? "
+                "ORDER BY next_attempt LIMIT 1",
+                (QUEUED, now)
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE tickets SET status = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                    (SENDING, now, row["id"])
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        if orphaned:
+            self.log.error("%s ticket(s) were orphaned mid-send and need manual reconciliation", orphaned)
+        return row
+
+    def _idle_time(self) -> float:
+        """Seconds until the next queued job is due, capped at the poll interval"""
+        try:
+            row = self._connection().execute(
+                "SELECT MIN(next_attempt) FROM tickets WHERE status = ?", (QUEUED,)
+            ).fetchone()
+        except sqlite3.Error:
+            return POLL_INTERVAL
+        if row[0] is None:
+            return POLL_INTERVAL
+        return min(max(row[0] - time.time(), 0), POLL_INTERVAL)
+
+    def _finish(self, job_id: str, status: str, **columns) -> None:
+        assignments = "".join(f", {column} = ?" for column in columns)
+        self._connection().execute(
+            f"UPDATE tickets SET status = ?, updated = ?{assignments} WHERE id = ?",
+            (status, time.time(), *columns.values(), job_id)
+        )
+
+    def _send(self, job: sqlite3.Row) -> None:
+        import requests
+
+        attempts = job["attempts"] + 1
+        error = None
+
+        try:
+            with self.app.app_context():
+                response = FreshDeskAPI().create_path_ticket(**json.loads(job["payload"]))
+        except requests.RequestException as e:
+            if not _never_sent(e):
+                self.log.error("Ticket %s may or may not have been created, leaving it for reconciliation: %s",
+                               job["id"], e)
+                self._finish(job["id"], UNKNOWN, error=str(e))
+                return
+            response = None
+            error = str(e)
+
+        if response is not None:
+            if response.ok:
+                self._finish(job["id"], SENT, response_code=response.status_code, response=response.text, error=None)
+                return
+
+            error = f"Freshdesk responded with {response.status_code}: {response.text}"
+            if response.status_code < 500 and response.status_code not in POST_RETRY_STATUSES:
+                # The ticket itself was rejected, sending it again will not help
+                self._finish(job["id"], FAILED, response_code=response.status_code, error=error)
+                return
+            if response.status_code not in POST_RETRY_STATUSES:
+                self.log.error("Ticket %s may or may not have been created, leaving it for reconciliation: %s",
+                               job["id"], error)
+                self._finish(job["id"], UNKNOWN, response_code=response.status_code, error=error)
+                return
+
+        if attempts >= self.max_attempts:
+            self.log.error("Giving up on ticket %s after %s attempts: %s", job["id"], attempts, error)
+            self._finish(job["id"], FAILED, error=error)
+            return
+
+        delay = min(self.retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+        self.log.warning("Ticket %s failed (attempt %s), retrying in %ss: %s", job["id"], attempts, delay, error)
+        self._finish(job["id"], QUEUED, next_attempt=time.time() + delay, error=error)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error:
+                self.log.exception("Failed to claim a ticket from the queue")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self._idle_time())
+                self._wakeup.clear()
+                continue
+
+            try:
+                self._send(job)
+            except Exception:
+                self.log.exception("Failed to process ticket %s", job["id"])
+
+
+def _never_sent(error) -> bool:
+    """Return True if ``error`` shows the request never reached Freshdesk"""
+    import requests
+    from urllib3.exceptions import ConnectTimeoutError
+
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    # Connections that were never made surface as a MaxRetryError over a NewConnectionError
+    # (a ConnectTimeoutError); a reset after the ticket was sent is a ProtocolError instead
+    return isinstance(getattr(error.args[0], "reason", None), ConnectTimeoutError)
+
+
+def start_ticket_queue(app) -> Optional[TicketQueue]:
+    """
+    Start the app's ticket queue workers if FRESHDESK_TICKET_QUEUE names a database,
+    which switches ticket submission to asynchronous mode, unless the app is under test
+    """
+    path = app.config.get("FRESHDESK_TICKET_QUEUE")
+    if not path or app.testing:
+        return None
+
+    queue = TicketQueue(
+        app,
+        path,
+        workers=app.config.get("FRESHDESK_QUEUE_WORKERS", DEFAULT_WORKERS),
+        max_attempts=app.config.get("FRESHDESK_QUEUE_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS),
+        retry_delay=app.config.get("FRESHDESK_QUEUE_RETRY_DELAY", DEFAULT_RETRY_DELAY)
+    )
+    app.extensions["ticket_queue"] = queue
+    queue.start()
+
+    return queue
@@ -0,0 +1,26 @@
+from flask import (
+    Blueprint,
+    current_app
+)
+
+from .models.response import ErrorResponse, OkResponse, make_api_response
+
+topology_api_bp = Blueprint(
+    "topology_api",
+    __name__,
+    url_prefix="/topology"
+)
+
+
+@topology_api_bp.route("/status", methods=["GET"])
+def status():
+    """Endpoint reporting how stale the served topology is and the refresher's breaker state"""
+
+    refresher = current_app.extensions.get("topology_refresher")
+    if refresher is None:
+        return make_api_response(ErrorResponse(status="error", error=[{
+            "code": "not_running",
+            "message": "The topology refresher is not running"
+        }]), 503)
+
+    return make_api_response(OkResponse(status="ok", data=refresher.status()), 200)
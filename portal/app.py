@@ -1,17 +1,30 @@
 from flask import (
     Flask,
-    render_template
+    render_template,
+    request
 )
 import flask_assets
 import os
 
-from portal.website import website_bp
+from portal.website import website_bp, CACHED_PAGES
+from portal.website.page_cache import init_page_cache
 from portal.api import api_bp
+from portal.api.freshdesk import get_session
+from portal.api.ticket_queue import start_ticket_queue
+from portal.metrics import init_metrics
+from portal.website.util import get_captcha_verifier
 
+from portal.context_processors import user_info
 from portal.template_filters import contact_us
+from portal.sources import configure_topology_cache, start_topology_refresher
+
+# Output of the ahead-of-time asset build, see portal/assets.py
+ASSET_BUILD_DIR = "dist"
+ASSET_MANIFEST = f"{ASSET_BUILD_DIR}/manifest.json"
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
 
 BLUEPRINTS = [website_bp, api_bp]
-CONTEXT_PROCESSORS = []
+CONTEXT_PROCESSORS = [user_info]
 TEMPLATE_FILTERS = [contact_us]
 
 if os.path.exists("config.py"):
@@ -20,6 +33,13 @@ else:
   HERE = os.path.dirname(__file__)
 
 def define_assets(app) -> None:
+    """
+    Register the asset bundles
+
+    If ``python -m portal.assets`` has written a manifest, the bundles resolve to its
+    content-hashed, minified files and nothing is compiled at runtime. Debug
+    mode, and deployments without a build, compile on demand as before.
+    """
     assets = flask_assets.Environment(app)
     assets.url = app.static_url_path
     assets.config['SECRET_KEY'] = 'secret!'
@@ -29,18 +49,39 @@ def define_assets(app) -> None:
     assets.config['PYSCSS_ASSETS_URL'] = assets.url
     assets.config['PYSCSS_ASSETS_ROOT'] = assets.directory
 
-    if not app.debug:
+    manifest_path = os.path.join(app.static_folder, ASSET_MANIFEST)
+    prebuilt = app.config.get("ASSETS_BUILD") or (not app.debug and os.path.exists(manifest_path))
+
+    if prebuilt:
+        assets.cache = False
+        assets.versions = "hash"
+        assets.manifest = f"json:{manifest_path}"
+        assets.auto_build = bool(app.config.get("ASSETS_BUILD"))
+        assets.url_expire = False
+        assets.config['LIBSASS_STYLE'] = "compressed"
+    elif not app.debug:
         assets.cache = False
         assets.manifest = False
 
     css_main = flask_assets.Bundle(
         "scss/main.scss",
         filters="libsass",
-        output="css/main.css"
+        output=f"{ASSET_BUILD_DIR}/main.%(version)s.css" if prebuilt else "css/main.css"
     )
 
     assets.register("css_main", css_main)
 
+
+def set_asset_cache_headers(response):
+    """Let clients cache content-hashed build outputs for a year"""
+    if request.path.startswith(f"{request.script_root}/static/{ASSET_BUILD_DIR}/") and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
 def load_config(app: Flask, test_config: str) -> None:
 
     if test_config is None:
@@ -57,11 +98,31 @@ def load_config(app: Flask, test_config: str) -> None:
             app.config[key] = val
 
 
+def warm_up(app) -> None:
+    """
+    Do the work a cold process would otherwise do on its first requests: compile every
+    template, open the outbound clients and render the cached pages
+    """
+    for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith(".html")):
+        app.jinja_env.get_template(name)
+
+    if app.config.get("FRESHDESK_API_URL"):
+        get_session(app.config)
+    if app.config.get("H_CAPTCHA_SECRET"):
+        get_captcha_verifier(app)
+
+    page_cache = app.extensions.get("page_cache")
+    if page_cache is not None:
+        page_cache.prerender(CACHED_PAGES)
+
+
 def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=True)
 
     load_config(app, test_config)
     define_assets(app)
+    configure_topology_cache(app)
+    init_metrics(app)
 
     @app.errorhandler(404)
     def page_not_found(e):
@@ -78,7 +139,17 @@ def create_app(test_config=None):
         for tf in TEMPLATE_FILTERS:
             app.add_template_filter(tf)
 
-    app.logger.debug(f"Created: Location is '{HERE}'")
+    init_page_cache(app, CACHED_PAGES)
+
+    app.after_request(set_asset_cache_headers)
+
+    start_topology_refresher(app)
+    start_ticket_queue(app)
+
+    if app.config.get("PORTAL_WARMUP"):
+        warm_up(app)
+
+    app.logger.debug("Created: Location is '%s'", HERE)
     return app
 
 
@@ -0,0 +1,11 @@
+from werkzeug.local import LocalProxy
+
+from portal.sources import get_user_info
+
+
+def user_info():
+    """
+    Expose the requesting user's identity to templates as ``user_info``; it is only
+    built if a template reads it
+    """
+    return {"user_info": LocalProxy(get_user_info)}
@@ -6,5 +6,9 @@ class ConfigurationError(AppError):
     pass
 
 
+class TopologyError(AppError):
+    pass
+
+
 class CondorToolException(Exception):
     pass
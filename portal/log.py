@@ -0,0 +1,195 @@
+"""
+Non-blocking, structured logging for the WSGI app
+
+Request threads only filter a record, render its message and put it on a queue. A
+single listener thread per process formats records as one JSON object per line and
+writes them to stderr, which mod_wsgi sends to the Apache error log. Presets set the levels of
+the root and chatty loggers and can sample a fraction of a logger's records below
+WARNING; warnings and errors are never sampled.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Dict, Optional
+
+from .exceptions import ConfigurationError
+
+PRESETS = {
+    "production": {
+        "level": "INFO",
+        "loggers": {
+            "urllib3": "WARNING",
+            "werkzeug": "WARNING",
+        },
+        # Logger name -> fraction of its records below WARNING that are kept
+        "sampling": {
+            "portal.api.freshdesk": 0.1,
+        },
+    },
+    "development": {
+        "level": "DEBUG",
+        "loggers": {},
+        "sampling": {},
+    },
+}
+DEFAULT_PRESET = "production"
+QUEUE_SIZE = 10000
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as single-line JSON objects, including any ``extra`` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a ``rate`` fraction of records below WARNING from the matching loggers"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache = {}  # logger name -> rate of its closest configured ancestor
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            candidate = name
+            while candidate:
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+                candidate = candidate.rpartition(".")[0]
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records with their message and traceback rendered, leaving the JSON
+    encoding and the write to the listener thread
+    """
+
+    _exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments may be request-bound proxies or change after the call, so they
+        # are rendered here, on the calling thread, like the stdlib handler does
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Drop rather than block a request when the listener can't keep up
+            pass
+
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """Parse ``"logger=rate,logger=rate"`` as used by PORTAL_LOG_SAMPLING"""
+    rates = {}
+    for item in value.split(","):
+        name, _, rate = item.strip().partition("=")
+        if name:
+            rates[name] = float(rate)
+    return rates
+
+
+def configure_logging(
+        preset: Optional[str] = None,
+        level: Optional[str] = None,
+        sampling: Optional[Dict[str, float]] = None,
+        stream=None
+) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue to a JSON-writing listener thread
+
+    ``preset`` defaults to PORTAL_LOG_PRESET or "production". ``level`` and
+    ``sampling`` default to PORTAL_LOG_LEVEL and PORTAL_LOG_SAMPLING, and override
+    the preset's root level and add to its sampling rates.
+    """
+    preset = preset or os.environ.get("PORTAL_LOG_PRESET", DEFAULT_PRESET)
+    try:
+        settings = PRESETS[preset]
+    except KeyError:
+        raise ConfigurationError(f"Unknown log preset {preset!r}, expected one of {', '.join(PRESETS)}")
+    level = level or os.environ.get("PORTAL_LOG_LEVEL") or settings["level"]
+    rates = dict(settings["sampling"])
+    rates.update(sampling or parse_sampling(os.environ.get("PORTAL_LOG_SAMPLING", "")))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter())
+
+    records = queue.Queue(QUEUE_SIZE)
+    handler = QueueHandler(records)
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, logger_level in settings["loggers"].items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    global _listener
+    stop_logging()
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+    return _listener
+
+
+@atexit.register
+def stop_logging() -> None:
+    """Write out the queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
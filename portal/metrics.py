@@ -0,0 +1,200 @@
+"""
+In-process metrics served in the Prometheus text format
+
+Counters and histograms are plain dictionaries of label tuples guarded by one
+lock per metric, so recording a value costs a lock acquisition and a couple of
+dictionary operations. Each mod_wsgi process keeps its own values, so every
+series carries a ``pid`` label; sum over it to aggregate across processes.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from flask import Response, g, request
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    # Looked up per render rather than at import, since mod_wsgi may fork after importing
+    pairs = [("pid", os.getpid()), *zip(names, values)]
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            series = list(self._series.items())
+        for labels, value in sorted(series):
+            lines += self._render_series(labels, value)
+        return lines
+
+    def _render_series(self, labels: Labels, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        with self._lock:
+            return self._series.get(labels, 0)
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        with self._lock:
+            self._series[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # One count per bucket, one for +Inf, then the sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def _render_series(self, labels: Labels, series) -> List[str]:
+        names = self.labelnames + ("le",)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{_format_labels(names, labels + (le,))} {cumulative}")
+        base = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{base} {series[-1]}")
+        lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+PROCESS_START = registry.register(Gauge(
+    "portal_process_start_time_seconds", "Start time of the process since the epoch"
+))
+REQUESTS = registry.register(Counter(
+    "portal_requests_total", "Requests handled, by route", ("endpoint", "method", "status")
+))
+REQUEST_DURATION = registry.register(Histogram(
+    "portal_request_duration_seconds", "Time spent handling requests, by route", ("endpoint",)
+))
+UPSTREAM_REQUESTS = registry.register(Counter(
+    "portal_upstream_requests_total", "Outbound calls, by upstream service and outcome", ("upstream", "outcome")
+))
+UPSTREAM_DURATION = registry.register(Histogram(
+    "portal_upstream_duration_seconds", "Time spent waiting on outbound calls, by upstream service", ("upstream",)
+))
+TOPOLOGY_INDEX_DURATION = registry.register(Histogram(
+    "portal_topology_index_duration_seconds", "Time spent streaming and indexing topology responses"
+))
+CACHE_REQUESTS = registry.register(Counter(
+    "portal_cache_requests_total", "Cache lookups, by cache and result (hit, stale or miss)", ("cache", "result")
+))
+
+PROCESS_START.set(time.time())
+
+
+class UpstreamCall:
+    __slots__ = ("outcome",)
+
+    def __init__(self):
+        self.outcome = "ok"
+
+
+@contextmanager
+def track_upstream(upstream: str) -> Iterator[UpstreamCall]:
+    """
+    Time an outbound call; it counts as an error if it raises or the caller sets
+    ``outcome`` on the yielded object
+    """
+    call = UpstreamCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call.outcome = "error"
+        raise
+    finally:
+        UPSTREAM_DURATION.observe(time.perf_counter() - start, (upstream,))
+        UPSTREAM_REQUESTS.inc((upstream, call.outcome))
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        endpoint = request.endpoint or "none"
+        REQUEST_DURATION.observe(time.perf_counter() - start, (endpoint,))
+        REQUESTS.inc((endpoint, request.method, str(response.status_code)))
+    return response
+
+
+def metrics_view():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app) -> None:
+    """Record per-route metrics for ``app`` and serve them at /metrics, unless METRICS is off"""
+    if not app.config.get("METRICS", True):
+        return
+
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -5,120 +5,660 @@ try:  # py3
 except ImportError:  # py2
     from ConfigParser import ConfigParser
 
-from typing import Dict, List
+from collections import OrderedDict
+from functools import partial
+from typing import BinaryIO, Callable, Dict, List, NamedTuple, Optional
 import xml.etree.ElementTree as ET
+import hashlib
 import http.client
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
 import urllib.error
 import urllib.request
 
-from flask import current_app, request
+from flask import current_app, g, request
 
-from .exceptions import ConfigurationError
+from .exceptions import ConfigurationError, TopologyError
+from .metrics import CACHE_REQUESTS, TOPOLOGY_INDEX_DURATION, track_upstream
 
 TOPOLOGY_RG = "https://topology.opensciencegrid.org/rgsummary/xml"
 SERVICE_MAPPING = {'Submit Node': 109,
                    'Execution Endpoint': 157}
+# URL for all Execution Endpoint and Submit Node (access points) resources
+TOPOLOGY_URL = TOPOLOGY_RG + "?service=on" + "".join(
+    f"&service_{service_id}=on" for service_id in SERVICE_MAPPING.values()
+)
 
-def get_user_info():
-    try:
-        return current_app.config["USER_INFO_FAKE"]
-    except:
-        pass
-
-    result = {
-        "idp": request.environ.get("OIDC_CLAIM_idp_name", None),
-        "id": request.environ.get("OIDC_CLAIM_osgid", None),
-        "name": request.environ.get("OIDC_CLAIM_name", None),
-        "email": request.environ.get("OIDC_CLAIM_email", None)
+TOPOLOGY_READ_SIZE = 64 * 1024
+
+# CILogonID -> {service name -> [FQDNs of active resources]}
+TopologyIndex = Dict[str, Dict[str, List[str]]]
+
+DEFAULT_TOPOLOGY_CACHE_TTL = 300
+DEFAULT_TOPOLOGY_CACHE_SIZE = 8
+DEFAULT_TOPOLOGY_TIMEOUT = 30
+DEFAULT_TOPOLOGY_RETRY_DELAY = 10
+DEFAULT_TOPOLOGY_MAX_BACKOFF = 900
+DEFAULT_TOPOLOGY_BREAKER_THRESHOLD = 3
+
+log = logging.getLogger(__name__)
+
+
+class TopologyCache:
+    """
+    Process-wide TTL cache of indexed OSG Topology queries, keyed by URL.
+
+    Fresh entries are returned directly. Expired entries are still returned
+    while a single background thread refreshes them, so a short Topology
+    outage only means serving slightly older data. Only a cold miss blocks,
+    and concurrent cold misses for the same URL share one fetch.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TOPOLOGY_CACHE_TTL, max_entries: int = DEFAULT_TOPOLOGY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # url -> (fetched_at, value)
+        self._loading = {}  # url -> lock held while the url is cold-loaded
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, url: str, loader: Callable):
+        """Return the cached value for ``url``, calling ``loader(url)`` to fill it"""
+        with self._lock:
+            entry = self._lookup(url)
+            if entry is not None:
+                fetched_at, value = entry
+                stale = time.monotonic() - fetched_at >= self.ttl
+                if stale and url not in self._refreshing:
+                    self._refreshing.add(url)
+                    threading.Thread(
+                        target=self._refresh, args=(url, loader), daemon=True
+                    ).start()
+                CACHE_REQUESTS.inc(("topology", "stale" if stale else "hit"))
+                return value
+
+            load_lock = self._loading.setdefault(url, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._lookup(url)
+            if entry is not None:
+                CACHE_REQUESTS.inc(("topology", "hit"))
+                return entry[1]
+
+            CACHE_REQUESTS.inc(("topology", "miss"))
+            value = loader(url)
+            self._store(url, value)
+            return value
+
+    def peek(self, url: str):
+        """Return the cached value for ``url``, however old, or None without loading it"""
+        with self._lock:
+            entry = self._lookup(url)
+        if entry is None:
+            CACHE_REQUESTS.inc(("topology", "miss"))
+            return None
+        stale = time.monotonic() - entry[0] >= self.ttl
+        CACHE_REQUESTS.inc(("topology", "stale" if stale else "hit"))
+        return entry[1]
+
+    def age(self, url: str) -> Optional[float]:
+        """Seconds since the entry for ``url`` was fetched, or None if there is no entry"""
+        with self._lock:
+            entry = self._entries.get(url)
+        return None if entry is None else time.monotonic() - entry[0]
+
+    def prime(self, url: str, value, age: float = 0) -> None:
+        """Seed the entry for ``url`` with a value that was fetched ``age`` seconds ago"""
+        with self._lock:
+            self._entries[url] = (time.monotonic() - age, value)
+            self._entries.move_to_end(url)
+            self._evict()
+
+    def invalidate(self, url: str = None) -> None:
+        """Drop the entry for ``url``, or every entry if no url is given"""
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(url, None)
+
+    def _lookup(self, url):
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def _store(self, url, value):
+        with self._lock:
+            self._entries[url] = (time.monotonic(), value)
+            self._entries.move_to_end(url)
+            self._evict()
+            self._loading.pop(url, None)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _refresh(self, url, loader):
+        try:
+            self._store(url, loader(url))
+        except TopologyError as e:
+            log.warning("Refreshing %s failed, serving stale data: %s", url, e)
+        except Exception:
+            log.exception("Refreshing %s failed, serving stale data", url)
+        finally:
+            with self._lock:
+                self._refreshing.discard(url)
+
+
+class TopologySnapshot(NamedTuple):
+    index: TopologyIndex
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = 0.0
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class TopologySnapshots:
+    """
+    Indexed topology queries persisted on local disk, one JSON file per URL.
+
+    Every mod_wsgi process reads and writes the same directory, so a refresh done
+    by one worker is picked up by the others and survives restarts. Writes go
+    through a temporary file and a rename so readers never see a partial file.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory
+
+    def path(self, url: str) -> str:
+        digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"topology-{digest}.json")
+
+    def read(self, url: str) -> Optional[TopologySnapshot]:
+        if not self.directory:
+            return None
+
+        try:
+            with open(self.path(url), "rb") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            log.exception("Ignoring unreadable topology snapshot for %s", url)
+            return None
+
+        if data.get("url") != url:
+            return None
+
+        return TopologySnapshot(
+            index=data["index"],
+            etag=data.get("etag"),
+            last_modified=data.get("last_modified"),
+            fetched_at=data.get("fetched_at", 0.0)
+        )
+
+    def write(self, url: str, snapshot: TopologySnapshot) -> None:
+        if not self.directory:
+            return
+
+        data = {"url": url, **snapshot._asdict()}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(f.name, self.path(url))
+        except OSError:
+            log.exception("Failed to write topology snapshot for %s", url)
+
+
+class TopologyRefresher:
+    """
+    Background thread that keeps the topology cache up to date on a schedule.
+
+    Repeated failures back off exponentially and, after ``breaker_threshold`` in a
+    row, open a circuit breaker: request handlers keep being served the last good
+    data and the next attempt is a single half-open probe once the backoff elapses.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(
+            self,
+            cache: TopologyCache,
+            url: str = None,
+            interval: float = DEFAULT_TOPOLOGY_CACHE_TTL,
+            timeout: float = DEFAULT_TOPOLOGY_TIMEOUT,
+            retry_delay: float = DEFAULT_TOPOLOGY_RETRY_DELAY,
+            max_backoff: float = DEFAULT_TOPOLOGY_MAX_BACKOFF,
+            breaker_threshold: int = DEFAULT_TOPOLOGY_BREAKER_THRESHOLD
+    ):
+        self.cache = cache
+        self.url = url or TOPOLOGY_URL
+        self.interval = interval
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.breaker_threshold = breaker_threshold
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.last_error = None
+        self.next_attempt = None
+
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="topology-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def refresh(self) -> float:
+        """Refresh the cache once and return the number of seconds until the next attempt"""
+        with self._lock:
+            if self.state == self.OPEN:
+                self.state = self.HALF_OPEN
+
+        try:
+            snapshot = load_topology_snapshot(self.url, timeout=self.timeout)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                self.last_error = str(e)
+                if self.failures >= self.breaker_threshold:
+                    self.state = self.OPEN
+                delay = min(self.retry_delay * 2 ** (self.failures - 1), self.max_backoff)
+            log.warning("Refreshing OSG Topology failed (%s in a row), retrying in %ss: %s",
+                        self.failures, delay, e)
+        else:
+            # Another worker may have fetched it a while ago, keep its age honest
+            self.cache.prime(self.url, snapshot.index, max(snapshot.age, 0))
+            with self._lock:
+                self.state = self.CLOSED
+                self.failures = 0
+                self.last_error = None
+                delay = self.interval
+
+        with self._lock:
+            self.next_attempt = time.time() + delay
+        return delay
+
+    def status(self) -> Dict:
+        """Report how old the served topology is and whether the breaker is open"""
+        with self._lock:
+            return {
+                "running": self.running,
+                "state": self.state,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "snapshot_age": self.cache.age(self.url),
+                "next_attempt_in": None if self.next_attempt is None else max(self.next_attempt - time.time(), 0)
+            }
+
+    def _run(self):
+        age = self.cache.age(self.url)
+        delay = 0 if age is None else max(self.interval - age, 0)
+        while not self._stopped.wait(delay):
+            delay = self.refresh()
+
+
+topology_cache = TopologyCache()
+topology_snapshots = TopologySnapshots()
+
+
+def configure_topology_cache(app) -> None:
+    """
+    Apply the app's topology cache settings to the process-wide cache and seed it
+    from the on-disk snapshot, if there is one
+    """
+    topology_cache.ttl = app.config.get("TOPOLOGY_CACHE_TTL", DEFAULT_TOPOLOGY_CACHE_TTL)
+    topology_cache.max_entries = app.config.get("TOPOLOGY_CACHE_SIZE", DEFAULT_TOPOLOGY_CACHE_SIZE)
+    topology_snapshots.directory = app.config.get("TOPOLOGY_SNAPSHOT_DIR")
+
+    url = app.config.get("TOPOLOGY_URL", TOPOLOGY_URL)
+    snapshot = topology_snapshots.read(url)
+    if snapshot is not None:
+        topology_cache.prime(url, snapshot.index, max(snapshot.age, 0))
+
+
+def start_topology_refresher(app) -> Optional[TopologyRefresher]:
+    """
+    Start the app's background topology refresher unless TOPOLOGY_REFRESH_INTERVAL is
+    0 or the app is under test. Once it runs, request handlers only read the cache.
+    """
+    interval = app.config.get("TOPOLOGY_REFRESH_INTERVAL", topology_cache.ttl)
+    if not interval or app.testing:
+        return None
+
+    refresher = TopologyRefresher(
+        topology_cache,
+        url=app.config.get("TOPOLOGY_URL", TOPOLOGY_URL),
+        interval=interval,
+        timeout=app.config.get("TOPOLOGY_TIMEOUT", DEFAULT_TOPOLOGY_TIMEOUT),
+        retry_delay=app.config.get("TOPOLOGY_RETRY_DELAY", DEFAULT_TOPOLOGY_RETRY_DELAY),
+        max_backoff=app.config.get("TOPOLOGY_MAX_BACKOFF", DEFAULT_TOPOLOGY_MAX_BACKOFF),
+        breaker_threshold=app.config.get("TOPOLOGY_BREAKER_THRESHOLD", DEFAULT_TOPOLOGY_BREAKER_THRESHOLD)
+    )
+    app.extensions["topology_refresher"] = refresher
+    refresher.start()
+
+    return refresher
+
+
+class UserInfo:
+    """
+    Identity of the requesting user, from the OIDC claims mod_auth_openidc puts in
+    the WSGI environ
+
+    Supports ``get`` and ``[]`` like the dict it replaces. Instances compare and hash
+    by ``key``, the identity provider and user ID, so they can be used directly as
+    per-user cache keys that survive a change of name or email.
+    """
+    __slots__ = ("idp", "id", "name", "email")
+
+    # Field -> environ variable it is read from
+    CLAIMS = {
+        "idp": "OIDC_CLAIM_idp_name",
+        "id": "OIDC_CLAIM_osgid",
+        "name": "OIDC_CLAIM_name",
+        "email": "OIDC_CLAIM_email",
     }
 
-    current_app.logger.debug("Authenticated user info is {}".format(str(result)))
+    def __init__(self, idp: str = None, id: str = None, name: str = None, email: str = None):
+        self.idp = idp
+        self.id = id
+        self.name = name
+        self.email = email
+
+    @classmethod
+    def from_environ(cls, environ: Dict) -> "UserInfo":
+        return cls(*(environ.get(variable) for variable in cls.CLAIMS.values()))
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "UserInfo":
+        return cls(*(data.get(field) for field in cls.__slots__))
+
+    @property
+    def key(self) -> tuple:
+        return (self.idp, self.id)
+
+    def get(self, field: str, default=None):
+        if field not in self.CLAIMS:
+            return default
+        return getattr(self, field)
+
+    def __getitem__(self, field: str):
+        if field not in self.CLAIMS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other):
+        return isinstance(other, UserInfo) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"UserInfo({self.to_dict()!r})"
+
+
+def get_user_info() -> UserInfo:
+    """Return the requesting user's identity, built on first use and kept on ``flask.g``"""
+    user_info = g.get("user_info")
+    if user_info is not None:
+        return user_info
 
-    return result
+    fake = current_app.config.get("USER_INFO_FAKE")
+    if fake is not None:
+        user_info = UserInfo.from_dict(fake)
+    else:
+        user_info = UserInfo.from_environ(request.environ)
+        current_app.logger.debug("Authenticated user info is %s", user_info)
 
+    g.user_info = user_info
+    return user_info
 
-def is_signed_up(user_info):
+
+def is_signed_up(user_info: UserInfo = None):
+    if user_info is None:
+        user_info = get_user_info()
     return user_info.get("id")
 
 
-def get_access_point_fqdns(user_info: Dict) -> List[str]:
+def is_admin(user_info: UserInfo = None):
+    """Return True if the user's email is listed in ADMIN_EMAILS"""
+    if user_info is None:
+        user_info = get_user_info()
+    email = user_info.get("email")
+    if not email:
+        return False
+
+    admin_emails = current_app.config.get("ADMIN_EMAILS", "")
+    if isinstance(admin_emails, str):
+        admin_emails = admin_emails.replace(",", " ").split()
+
+    return email.lower() in {admin_email.lower() for admin_email in admin_emails}
+
+
+def get_access_point_fqdns(user_info: Optional[UserInfo]) -> List[str]:
     """Return a list of access point FQDNs administered by the user
     """
     return get_sources(user_info, 'Submit Node')
 
 
-def get_execution_endpoint_fqdns(user_info: Dict) -> List[str]:
+def get_execution_endpoint_fqdns(user_info: Optional[UserInfo]) -> List[str]:
     """Return a list of execution endpoint FQDNs administered by the user
     """
     return get_sources(user_info, 'Execution Endpoint')
 
 
-def get_sources(user_info: Dict, topology_service: str):
+def index_resource(resource: ET.Element, index: TopologyIndex) -> None:
     """
-    Query topology to get a list of FQDNs for active resources administered by the user
+    Add the administrative contacts of a single active resource to the index
     """
-    osgid = user_info.get("id")
-    if not osgid:
-        return []
-    # URL for all Execution Endpoint and Submit Node (access points) resources
-    topology_url = TOPOLOGY_RG + f'?service=on&service_{SERVICE_MAPPING[topology_service]}=on'
     try:
-        response = urllib.request.urlopen(topology_url)
-        topology_xml = response.read()
-    except (urllib.error.URLError, http.client.HTTPException):
-        raise TopologyError('Error retrieving OSG Topology registrations')
+        fqdn = resource.find('./FQDN').text.strip()
+    except AttributeError:
+        # skip malformed resource missing an FQDN
+        return
+
+    try:
+        active = resource.find('./Active').text.strip().lower() == "true"
+    except AttributeError:
+        return
+    if not active:
+        return
+
+    try:
+        services = [service.find("./Name").text.strip()
+                    for service in resource.findall("./Services/Service")]
+    except AttributeError:
+        return
+    if not services:
+        return
+
+    for contact_list in resource.findall('./ContactLists/ContactList'):
+        if contact_list.findtext('./ContactType', '').strip() != 'Administrative Contact':
+            continue
+        contacts = contact_list.find('./Contacts')
+        if contacts is None:
+            # skip malformed contact list missing contacts
+            continue
+
+        for contact in contacts.findall("./Contact"):
+            osgid = contact.findtext('./CILogonID', '').strip()
+            if not osgid:
+                continue
+            user_services = index.setdefault(osgid, {})
+            for service in services:
+                user_services.setdefault(service, []).append(fqdn)
+
+
+def index_topology(stream: BinaryIO) -> TopologyIndex:
+    """
+    Build the CILogonID lookup table for a topology query in a single streaming pass
+
+    Each Resource is indexed as soon as it has been parsed and then dropped from the
+    tree, so memory use stays flat no matter how large the document grows.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    index = {}
+    path = []
+    n_bytes = n_resources = 0
 
     try:
-        topology_et = ET.fromstring(topology_xml)
+        while True:
+            try:
+                chunk = stream.read(TOPOLOGY_READ_SIZE)
+            except (urllib.error.URLError, http.client.HTTPException, OSError):
+                raise TopologyError('Error retrieving OSG Topology registrations')
+            if not chunk:
+                break
+            n_bytes += len(chunk)
+            parser.feed(chunk)
+
+            for event, element in parser.read_events():
+                if event == "start":
+                    path.append(element)
+                    continue
+
+                path.pop()
+                if len(path) == 3 and element.tag == "Resource" \
+                        and path[1].tag == "ResourceGroup" and path[2].tag == "Resources":
+                    index_resource(element, index)
+                    n_resources += 1
+                    path[2].remove(element)
+                elif len(path) == 1 and element.tag == "ResourceGroup":
+                    path[0].remove(element)
+
+        parser.close()
     except ET.ParseError:
-        if not topology_xml:
+        if not n_bytes:
             msg = 'OSG Topology query returned empty response'
         else:
             msg = 'OSG Topology query returned malformed XML'
         raise TopologyError(msg)
 
-    os_pool_resources = []
-    resources = topology_et.findall('./ResourceGroup/Resources/Resource')
-    if not resources:
+    if not n_resources:
         raise TopologyError('Failed to find any OSG Topology resources')
 
-    for resource in resources:
-        try:
-            fqdn = resource.find('./FQDN').text.strip()
-        except AttributeError:
-            # skip malformed resource missing an FQDN
-            continue
+    return index
 
-        active = False
-        try:
-            active = resource.find('./Active').text.strip().lower() == "true"
-        except AttributeError:
-            continue
-        if not active:
-            continue
 
-        try:
-            services = [service.find("./Name").text.strip()
-                        for service in resource.findall("./Services/Service")]
-        except AttributeError:
-            continue
-        if topology_service not in services:
-            continue
+def load_topology_snapshot(topology_url: str, timeout: float = DEFAULT_TOPOLOGY_TIMEOUT) -> TopologySnapshot:
+    """
+    Download and index a topology query, returning the index with when it was fetched
+
+    A snapshot another worker refreshed within the cache TTL is used as-is, along
+    with its original fetch time. Otherwise the query is made conditional on the
+    snapshot's ETag / Last-Modified so unchanged topology only costs a 304.
+
+    The upstream metrics cover the wait for Topology's response headers; streaming
+    the body into the index is timed separately, as it is mostly parsing.
+    """
+    snapshot = topology_snapshots.read(topology_url)
+    if snapshot is not None and 0 <= snapshot.age < topology_cache.ttl:
+        return snapshot
 
+    headers = {}
+    if snapshot is not None:
+        if snapshot.etag:
+            headers["If-None-Match"] = snapshot.etag
+        if snapshot.last_modified:
+            headers["If-Modified-Since"] = snapshot.last_modified
+
+    with track_upstream("topology") as call:
         try:
-            admin_contacts = [contact_list.find('./Contacts')
-                              for contact_list in resource.findall('./ContactLists/ContactList')
-                              if contact_list.findtext('./ContactType', '').strip() == 'Administrative Contact']
-        except AttributeError:
-            # skip malformed resource missing contacts
-            continue
+            response = urllib.request.urlopen(urllib.request.Request(topology_url, headers=headers), timeout=timeout)
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or snapshot is None:
+                raise TopologyError('Error retrieving OSG Topology registrations')
+            call.outcome = "not_modified"
+            snapshot = snapshot._replace(fetched_at=time.time())
+            topology_snapshots.write(topology_url, snapshot)
+            return snapshot
+        except (urllib.error.URLError, http.client.HTTPException):
+            raise TopologyError('Error retrieving OSG Topology registrations')
+
+    start = time.perf_counter()
+    try:
+        with response:
+            index = index_topology(response)
+    finally:
+        TOPOLOGY_INDEX_DURATION.observe(time.perf_counter() - start)
+
+    snapshot = TopologySnapshot(
+        index=index,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        fetched_at=time.time()
+    )
+    topology_snapshots.write(topology_url, snapshot)
+    return snapshot
+
+
+def load_topology_index(topology_url: str, timeout: float = DEFAULT_TOPOLOGY_TIMEOUT) -> TopologyIndex:
+    """Download and index a topology query, see ``load_topology_snapshot``"""
+    return load_topology_snapshot(topology_url, timeout=timeout).index
+
+
+def get_all_sources(user_info: Optional[UserInfo] = None) -> Dict[str, List[str]]:
+    """
+    Query topology once for every service in SERVICE_MAPPING and return the FQDNs of
+    active resources administered by the user (by default the requesting user),
+    grouped by service
+    """
+    if user_info is None:
+        user_info = get_user_info()
+    osgid = user_info.get("id")
+    if not osgid:
+        return {service: [] for service in SERVICE_MAPPING}
+
+    url = current_app.config.get("TOPOLOGY_URL", TOPOLOGY_URL)
+    refresher = current_app.extensions.get("topology_refresher")
+    if refresher is not None and refresher.running:
+        topology_index = topology_cache.peek(url)
+        if topology_index is None:
+            raise TopologyError('OSG Topology registrations have not been retrieved yet')
+    else:
+        loader = partial(
+            load_topology_index,
+            timeout=current_app.config.get("TOPOLOGY_TIMEOUT", DEFAULT_TOPOLOGY_TIMEOUT)
+        )
+        topology_index = topology_cache.get(url, loader)
 
-        for contact_list in admin_contacts:
-            for contact in contact_list.findall("./Contact"):
-                if contact.findtext('./CILogonID', '').strip() == osgid:
-                    os_pool_resources.append(fqdn)
+    user_services = topology_index.get(osgid, {})
+    return {service: list(user_services.get(service, [])) for service in SERVICE_MAPPING}
 
-    return os_pool_resources
+
+def get_sources(user_info: Optional[UserInfo], topology_service: str) -> List[str]:
+    """
+    Query topology to get a list of FQDNs for active resources administered by the user
+    """
+    return get_all_sources(user_info)[topology_service]
 
 
 SOURCE_CHECK = re.compile(r"^[a-zA-Z][-.0-9a-zA-Z]*$")
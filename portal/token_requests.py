@@ -0,0 +1,252 @@
+"""
+Pending IDTOKEN requests at the pool's collector, as made by register.py
+
+The Python bindings can submit a token request but not list or approve one, so
+this module drives ``condor_token_request_list`` and ``condor_token_request_approve``
+against the configured COLLECTOR. Their output is kept in a per-process cache so
+an admin's page load doesn't wait on the collector.
+"""
+
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from .exceptions import CondorToolException, ConfigurationError
+from .metrics import CACHE_REQUESTS, track_upstream
+
+DEFAULT_TOKEN_REQUEST_CACHE_TTL = 30
+DEFAULT_TOKEN_REQUEST_TIMEOUT = 20
+DEFAULT_TOKEN_APPROVE_CONCURRENCY = 4
+
+REQUEST_ID_CHECK = re.compile(r"^[0-9]+$")
+
+# Attribute of condor_token_request_list's ads -> key in the portal's request dicts
+REQUEST_ATTRIBUTES = {
+    "RequestId": "request_id",
+    "ClientId": "client_id",
+    "PeerLocation": "peer_location",
+    "RequestedIdentity": "identity",
+    "AuthenticatedIdentity": "authenticated_identity",
+    "LimitAuthorization": "scopes",
+}
+
+log = logging.getLogger(__name__)
+
+_cache_lock = threading.Lock()
+
+
+def parse_token_requests(output: str) -> Dict[str, Dict]:
+    """Turn ``condor_token_request_list -json`` output into request dicts keyed by request ID"""
+    requests = {}
+    for ad in json.loads(output) if output.strip() else []:
+        token_request = {key: ad.get(attribute) for attribute, key in REQUEST_ATTRIBUTES.items()}
+        if token_request["request_id"] is None:
+            continue
+        token_request["request_id"] = str(token_request["request_id"])
+        token_request["scopes"] = [scope.strip() for scope in (token_request["scopes"] or "").split(",") if scope.strip()]
+        requests[token_request["request_id"]] = token_request
+    return requests
+
+
+class CondorTokenTools:
+    """Run the token request command line tools against one collector"""
+
+    def __init__(self, collector: str, timeout: float = DEFAULT_TOKEN_REQUEST_TIMEOUT, bin_dir: str = None):
+        self.collector = collector
+        self.timeout = timeout
+        self.bin_dir = bin_dir
+
+    def _run(self, tool: str, *args: str, input: str = None) -> str:
+        command = [os.path.join(self.bin_dir, tool) if self.bin_dir else tool, "-pool", self.collector, *args]
+        with track_upstream("collector"):
+            try:
+                process = subprocess.run(
+                    command, input=input, capture_output=True, text=True, timeout=self.timeout
+                )
+            except (OSError, subprocess.TimeoutExpired) as e:
+                raise CondorToolException(f"{tool} failed: {e}")
+            if process.returncode != 0:
+                # The last line carries the reason; anything before it is progress output
+                message = (process.stderr.strip() or process.stdout.strip()).rpartition("\n")[2]
+                raise CondorToolException(f"{tool} exited with status {process.returncode}: {message}")
+        return process.stdout
+
+    def list(self, request_id: str = None) -> Dict[str, Dict]:
+        """Return the pending requests, or only ``request_id`` if it is pending"""
+        args = ["-json"] if request_id is None else ["-reqid", request_id, "-json"]
+        try:
+            return parse_token_requests(self._run("condor_token_request_list", *args))
+        except ValueError as e:
+            raise CondorToolException(f"condor_token_request_list printed malformed JSON: {e}")
+
+    def approve(self, request_id: str) -> None:
+        # The tool asks for confirmation on stdin
+        self._run("condor_token_request_approve", "-reqid", request_id, input="yes\n")
+
+
+class TokenRequestCache:
+    """
+    Per-process listing of the collector's pending token requests.
+
+    Reads are served from memory. Once the listing is older than ``ttl`` the next
+    read starts a single background refresh and is answered with what is cached,
+    so only a process's very first read waits on the collector. Between refreshes
+    the listing is kept current incrementally: a request ID that isn't in it, such
+    as one register.py has just created, is looked up on its own and merged in,
+    and approved requests are dropped as soon as they are approved.
+    """
+
+    def __init__(
+            self,
+            tools: CondorTokenTools,
+            ttl: float = DEFAULT_TOKEN_REQUEST_CACHE_TTL,
+            approve_concurrency: int = DEFAULT_TOKEN_APPROVE_CONCURRENCY
+    ):
+        self.tools = tools
+        self.ttl = ttl
+        self.approve_concurrency = approve_concurrency
+
+        self._requests = None  # request ID -> request dict, None until the first listing
+        self._fetched_at = None
+        self._first_seen = {}  # request ID -> time.time() it first appeared in a listing
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def pending(self) -> List[Dict]:
+        """Return the pending requests, newest first"""
+        with self._lock:
+            requests = self._requests
+            if requests is not None:
+                stale = time.monotonic() - self._fetched_at >= self.ttl
+                if stale and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, daemon=True).start()
+                CACHE_REQUESTS.inc(("token_requests", "stale" if stale else "hit"))
+
+        if requests is None:
+            requests = self._load()
+
+        return sorted(requests.values(), key=lambda token_request: token_request["first_seen"], reverse=True)
+
+    def get(self, request_id: str) -> Optional[Dict]:
+        """Return the pending request ``request_id``, asking the collector if it isn't cached"""
+        if self._requests is None:
+            self._load()
+
+        with self._lock:
+            token_request = self._requests.get(request_id)
+        if token_request is not None:
+            return token_request
+
+        found = self.tools.list(request_id).get(request_id)
+        if found is not None:
+            with self._lock:
+                self._requests = self._merge(self._requests, {request_id: found})
+                token_request = self._requests[request_id]
+        return token_request
+
+    def age(self) -> Optional[float]:
+        """Seconds since the listing was fetched, or None if it never was"""
+        with self._lock:
+            return None if self._fetched_at is None else time.monotonic() - self._fetched_at
+
+    def approve(self, request_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Approve each of ``request_ids``, a few at a time, and return a dict of
+        request ID -> None if it was approved or the error if it wasn't
+        """
+        request_ids = list(dict.fromkeys(request_ids))
+
+        def approve_one(request_id):
+            if not REQUEST_ID_CHECK.match(request_id):
+                return "Invalid request ID"
+            try:
+                self.tools.approve(request_id)
+            except CondorToolException as e:
+                log.warning("Approving token request %s failed: %s", request_id, e)
+                return str(e)
+            log.info("Approved token request %s", request_id)
+            return None
+
+        if not request_ids:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(min(self.approve_concurrency, len(request_ids)), 1)) as executor:
+            results = dict(zip(request_ids, executor.map(approve_one, request_ids)))
+
+        with self._lock:
+            if self._requests is not None:
+                self._requests = {
+                    request_id: token_request for request_id, token_request in self._requests.items()
+                    if request_id not in results or results[request_id] is not None
+                }
+        return results
+
+    def _merge(self, current: Optional[Dict], update: Dict, replace: bool = False) -> Dict:
+        """
+        Return a new listing with ``update`` applied to ``current``; with ``replace``,
+        requests missing from ``update`` are dropped. Called with ``_lock`` held.
+        """
+        now = time.time()
+        merged = {} if replace or current is None else dict(current)
+        for request_id, token_request in update.items():
+            first_seen = self._first_seen.setdefault(request_id, now)
+            merged[request_id] = {**token_request, "first_seen": first_seen}
+        if replace:
+            for request_id in self._first_seen.keys() - merged.keys():
+                del self._first_seen[request_id]
+        return merged
+
+    def _fetch(self) -> None:
+        requests = self.tools.list()
+        with self._lock:
+            self._requests = self._merge(self._requests, requests, replace=True)
+            self._fetched_at = time.monotonic()
+
+    def _load(self) -> Dict:
+        # Concurrent first reads share one listing
+        with self._load_lock:
+            if self._requests is None:
+                CACHE_REQUESTS.inc(("token_requests", "miss"))
+                self._fetch()
+            return self._requests
+
+    def _refresh(self):
+        try:
+            self._fetch()
+        except CondorToolException as e:
+            log.warning("Refreshing the token request listing failed, serving stale data: %s", e)
+        except Exception:
+            log.exception("Refreshing the token request listing failed, serving stale data")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+def get_token_request_cache(app) -> TokenRequestCache:
+    """Return the app's token request cache, creating it from the config on first use"""
+    with _cache_lock:
+        cache = app.extensions.get("token_requests")
+        if cache is None:
+            collector = app.config.get("COLLECTOR")
+            if not collector:
+                raise ConfigurationError("COLLECTOR must be set to list and approve token requests")
+
+            cache = TokenRequestCache(
+                CondorTokenTools(
+                    collector,
+                    timeout=app.config.get("TOKEN_REQUEST_TIMEOUT", DEFAULT_TOKEN_REQUEST_TIMEOUT),
+                    bin_dir=app.config.get("CONDOR_BIN_DIR")
+                ),
+                ttl=app.config.get("TOKEN_REQUEST_CACHE_TTL", DEFAULT_TOKEN_REQUEST_CACHE_TTL),
+                approve_concurrency=app.config.get("TOKEN_APPROVE_CONCURRENCY", DEFAULT_TOKEN_APPROVE_CONCURRENCY)
+            )
+            app.extensions["token_requests"] = cache
+
+        return cache
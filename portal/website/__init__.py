@@ -1 +1 @@
-from .views import website_bp
+from .views import website_bp, CACHED_PAGES
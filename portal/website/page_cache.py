@@ -0,0 +1,136 @@
+"""
+Cache of fully rendered, precompressed pages
+
+Pages whose output only depends on the app config are rendered once, either at
+startup or on their first hit, and stored together with gzip (and, if the brotli
+package is installed, brotli) variants and a strong ETag. Serving them is then a
+dictionary lookup, and revalidating clients get a 304 without a body. Requests
+from a signed-in user, or carrying a session cookie, are always rendered fresh.
+"""
+
+import gzip
+import hashlib
+import threading
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import Response, current_app, render_template, request
+
+from portal.metrics import CACHE_REQUESTS
+from portal.sources import UserInfo
+
+# Config values the cached templates read; a change to any of them is a new cache key
+PAGE_CONFIG_KEYS = ("SUPPORT_EMAIL",)
+
+
+class RenderedPage(NamedTuple):
+    etag: str
+    bodies: Dict[str, bytes]  # Content-Encoding ("identity", "gzip", "br") -> body
+
+
+class PageCache:
+
+    def __init__(self, app, config_keys: Tuple[str, ...] = PAGE_CONFIG_KEYS):
+        self.app = app
+        self.config_keys = config_keys
+
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def _key(self, template: str) -> Tuple:
+        return (template, request.script_root, *(self.app.config.get(key) for key in self.config_keys))
+
+    def get(self, template: str) -> RenderedPage:
+        """Return the rendered page for ``template``, rendering it if this is the first hit"""
+        key = self._key(template)
+        page = self._pages.get(key)
+        CACHE_REQUESTS.inc(("page", "miss" if page is None else "hit"))
+        if page is None:
+            page = self._render(template)
+            with self._lock:
+                page = self._pages.setdefault(key, page)
+        return page
+
+    def prerender(self, templates: Iterable[str]) -> None:
+        """Render ``templates`` ahead of the first request"""
+        with self.app.test_request_context():
+            for template in templates:
+                self.get(template)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+
+    @staticmethod
+    def _render(template: str) -> RenderedPage:
+        body = render_template(template).encode("utf-8")
+
+        bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            bodies["br"] = brotli.compress(body, quality=11)
+
+        return RenderedPage(etag=hashlib.sha256(body).hexdigest()[:32], bodies=bodies)
+
+    def response(self, template: str) -> Response:
+        """Serve ``template`` from the cache, negotiating the encoding and honouring If-None-Match"""
+        page = self.get(template)
+
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in page.bodies and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        # Each encoding is a different representation, so it gets its own strong ETag
+        etag = page.etag if encoding == "identity" else f"{page.etag}-{encoding}"
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(page.bodies[encoding], mimetype="text/html")
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept-Encoding")
+
+        return response
+
+
+def _has_identity() -> bool:
+    """Return True if the request comes from a signed-in user or carries a session"""
+    if any(variable in request.environ for variable in UserInfo.CLAIMS.values()):
+        return True
+    return current_app.config["SESSION_COOKIE_NAME"] in request.cookies
+
+
+def cached_page(template: str) -> Response:
+    """
+    Respond with a config-only page from the app's page cache, or render it directly
+    if the cache is disabled or the request is tied to a user
+    """
+    page_cache = current_app.extensions.get("page_cache")
+    if page_cache is None or _has_identity():
+        return current_app.make_response(render_template(template))
+
+    return page_cache.response(template)
+
+
+def init_page_cache(app, templates: Iterable[str]) -> None:
+    """
+    Create the app's page cache unless PAGE_CACHE is off or templates reload on change,
+    and render ``templates`` up front if PAGE_CACHE_PRERENDER is set
+    """
+    if not app.config.get("PAGE_CACHE", True) or app.debug:
+        return
+
+    page_cache = PageCache(app)
+    app.extensions["page_cache"] = page_cache
+
+    if app.config.get("PAGE_CACHE_PRERENDER", False):
+        page_cache.prerender(templates)
@@ -5,13 +5,20 @@ except ImportError:  # py2
 
 from flask import (
     Blueprint,
+    abort,
     current_app,
-    make_response,
     send_from_directory,
+    redirect,
     render_template,
-    redirect
+    request
 )
 
+from portal.exceptions import CondorToolException
+from portal.token_requests import REQUEST_ID_CHECK, get_token_request_cache
+
+from .page_cache import cached_page
+from .util import admin_required
+
 website_bp = Blueprint(
     "website",
     __name__,
@@ -20,19 +27,64 @@ website_bp = Blueprint(
     static_url_path="/static/index",
 )
 
+# Pages that only depend on the app config, served from the page cache
+CACHED_PAGES = ["index.html", "application.html", "credit-request.html"]
+
 @website_bp.route("/")
 def index():
-    return make_response(render_template("index.html"))
+    return cached_page("index.html")
 
 @website_bp.route("/application")
 def application():
-    return make_response(render_template("application.html"))
+    return cached_page("application.html")
+
+@website_bp.route("/credit-request")
+def credit_request():
+    return cached_page("credit-request.html")
 
 @website_bp.route("/health")
 def health():
     return "Hello!"
 
 
+@website_bp.route("/token", methods=["GET", "POST"])
+@admin_required
+def token():
+    """List pending token requests; admins approve the ones they tick"""
+    if request.method == "POST":
+        origin = request.headers.get("Origin")
+        if origin is not None and origin.rstrip("/") != request.host_url.rstrip("/"):
+            abort(403)
+
+    cache = get_token_request_cache(current_app)
+    code = request.args.get("code", "").strip()
+    results = None
+    error = None
+
+    try:
+        if request.method == "POST":
+            results = cache.approve(request.form.getlist("request_id"))
+        token_requests = cache.pending()
+        # The request register.py linked to may be newer than the cached listing
+        if REQUEST_ID_CHECK.match(code) and code not in (results or {}):
+            requested = cache.get(code)
+            if requested is not None and requested not in token_requests:
+                token_requests.insert(0, requested)
+    except CondorToolException as e:
+        current_app.logger.warning("Listing token requests failed: %s", e)
+        token_requests = []
+        error = "Could not get the pending token requests from the collector, please try again later."
+
+    return render_template(
+        "token.html",
+        token_requests=token_requests,
+        code=code,
+        results=results,
+        error=error,
+        age=cache.age()
+    ), 503 if error else 200
+
+
 @website_bp.route("/logout")
 def logout():
     try:
@@ -51,6 +103,6 @@ def logout():
         )
         return "Error!"
     url = "{}?{}".format(redirect_uri, urlencode(params))
-    current_app.logger.debug("Redirecting logout to", url)
+    current_app.logger.debug("Redirecting logout to %s", url)
     return redirect(url)
 
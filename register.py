@@ -2,14 +2,22 @@
 
 import logging
 import argparse
+import errno
+import json
 import os
+import random
+import selectors
+import signal
 import socket
 import subprocess
 import sys
+import tempfile
 import traceback
 import time
 import shutil
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import htcondor
 import classad
@@ -26,16 +34,50 @@ DEFAULT_TOKEN_SCOPES = ["READ", "ADVERTISE_MASTER"]
 RESOURCE_PREFIX = "RESOURCE-"
 RESOURCE_POSTFIX = "cm-1.ospool.osg-htc.org"
 NUM_RETRIES = 10
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 60
+CONNECT_TIMEOUT = 10
+CONNECT_STAGGER = 0.25  # Head start each address gets before the next one is tried (RFC 8305)
+RACE_FAILURE_TTL = 30  # Seconds a race no address won is remembered, so callers don't queue behind new ones
+MASTER_TIMEOUT = 10
+POLL_INTERVAL = 5
+MAX_CONCURRENT_REQUESTS = 16
+RECONFIG_DELAY = 10  # Approvals this close together share one reconfig in --agent mode
+TOKEN_DIRECTORY = "/etc/condor/tokens.d"
+SPOOL_DIRECTORY = "/var/lib/condor/registration"
+JOB_SUFFIX = ".job"
+ACTIVE_SUFFIX = ".active"
+STATUS_SUFFIX = ".status"
 TOKEN_OWNER_USER = TOKEN_OWNER_GROUP = "condor"
 SOURCE_CHECK = re.compile(r"^[a-zA-Z][-.0-9a-zA-Z]*$")
 
+# Client security for talking to the collector; calls to the local master
+# override these with the values they replaced, saved in _local_security
+COLLECTOR_SECURITY = {
+    "SEC_CLIENT_AUTHENTICATION_METHODS": "SSL",
+    "SEC_CLIENT_ENCRYPTION": "REQUIRED",
+}
+_local_security = {}
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Register a resource with the Open Science pool."
     )
 
-    parser.add_argument("--host", help="The resource hostname to register.", required=True)
+    parser.add_argument(
+        "--host",
+        action="append",
+        dest="hosts",
+        default=[],
+        metavar="HOST",
+        help="The resource hostname to register. May be specified multiple times to register several resources at once.",
+    )
+
+    parser.add_argument(
+        "--hosts-file",
+        help="File listing resource hostnames to register, one per line. Blank lines and lines starting with '#' are ignored.",
+    )
 
     parser.add_argument(
         "--pool",
@@ -67,10 +109,44 @@ def parse_args():
         help=f"Additional IDTOKEN scope to request (default: {DEFAULT_TOKEN_SCOPES}). May be specified multiple times."
     )
 
+    parser.add_argument(
+        "--agent",
+        action="store_true",
+        help="Keep running and register the hosts listed in job files dropped into the --spool directory.",
+    )
+
+    parser.add_argument(
+        "--spool",
+        default=SPOOL_DIRECTORY,
+        help="Directory --agent takes jobs from (default: {}). A job is a file named NAME{} listing hostnames like --hosts-file; progress is written to NAME{}.".format(
+            SPOOL_DIRECTORY, JOB_SUFFIX, STATUS_SUFFIX
+        ),
+    )
+
     args = parser.parse_args()
+
+    if args.hosts_file:
+        try:
+            args.hosts += read_hosts_file(args.hosts_file)
+        except OSError as e:
+            parser.error("could not read --hosts-file: {}".format(e))
+    # Drop duplicates, keeping the order hosts were given in
+    args.hosts = list(dict.fromkeys(args.hosts))
+    if args.agent:
+        if args.hosts:
+            parser.error("--agent takes hosts from job files in --spool, not from --host or --hosts-file")
+    elif not args.hosts:
+        parser.error("at least one --host or a --hosts-file is required")
+
     return args
 
 
+def read_hosts_file(path):
+    with open(path) as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+
 def main():
     args = parse_args()
 
@@ -92,10 +168,11 @@ def main():
 
         logger.addHandler(handler)
 
-    if not SOURCE_CHECK.match(args.host):
-        error(
-            "The requested hostname must be composed of only alphabetical characters (A-Z, a-z), digits (0-9), periods (.), and dashes (-). It may not begin with a digit."
-        )
+    for host in args.hosts:
+        if not SOURCE_CHECK.match(host):
+            error(
+                "The requested hostname {!r} must be composed of only alphabetical characters (A-Z, a-z), digits (0-9), periods (.), and dashes (-). It may not begin with a digit.".format(host)
+            )
 
     # TODO: Not clear this is necessary for Docker.
     #if not is_admin():
@@ -103,21 +180,280 @@ def main():
     #        "This command must be run as root (on Linux/Mac) or as an administrator (on Windows)"
     #    )
 
-    logger.debug('Setting SEC_CLIENT_AUTHENTICATION_METHODS to "SSL"')
-    htcondor.param["SEC_CLIENT_AUTHENTICATION_METHODS"] = "SSL"
-    htcondor.param["SEC_CLIENT_ENCRYPTION"] = "REQUIRED"
+    use_collector_security()
 
     # TODO: temporary fix for https://github.com/HTPhenotyping/registration/issues/17
     if htcondor.param["AUTH_SSL_CLIENT_CAFILE"] == "/etc/ssl/certs/ca-bundle.crt":
         htcondor.param["AUTH_SSL_CLIENT_CAFILE"] = "/etc/ssl/certs/ca-certificates.crt"
-    success = request_token(pool=args.pool, resource=args.host, scopes=args.scope, local_dir=args.local_dir)
+
+    if args.agent:
+        run_agent(args)
+        return
+
+    if len(args.hosts) > 1:
+        register_hosts(args)
+        return
+
+    host = args.hosts[0]
+    success = request_token(pool=args.pool, resource=host, scopes=args.scope, local_dir=args.local_dir)
 
     if not success:
         error("Failed to complete the token request workflow.")
 
     reconfig()
 
-    print("Registration of resource {} is complete!".format(args.host))
+    print("Registration of resource {} is complete!".format(host))
+
+
+def register_hosts(args):
+    """
+    Register every host in ``args.hosts`` with a single collector lookup and a
+    single reconfig, then print a per-host summary
+    """
+    results = request_tokens(pool=args.pool, resources=args.hosts, scopes=args.scope, local_dir=args.local_dir)
+
+    approved = [resource for resource, result in results.items() if result["status"] == "approved"]
+    if approved:
+        reconfig()
+
+    print("\nRegistration summary:")
+    width = max(len(resource) for resource in results)
+    for resource, result in results.items():
+        detail = result.get("path") or result.get("error") or ""
+        print("  {:<{}}  {:<8}  {}".format(resource, width, result["status"], detail))
+
+    if approved and not is_admin():
+        print(NONROOT_TOKENS_MSG.format(dir=args.local_dir or TOKEN_DIRECTORY))
+
+    failed = len(results) - len(approved)
+    if failed:
+        error("Failed to register {} of {} resources.".format(failed, len(results)))
+
+    print("Registration of {} resources is complete!".format(len(results)))
+
+
+def run_agent(args):
+    # Output goes to a log or the journal rather than a terminal
+    sys.stdout.reconfigure(line_buffering=True)
+
+    agent = RegistrationAgent(pool=args.pool, spool=args.spool, scopes=args.scope, local_dir=args.local_dir)
+    signal.signal(signal.SIGTERM, lambda signum, frame: agent.stop())
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        agent.shutdown()
+
+
+class RegistrationAgent:
+    """
+    Register hosts from job files in a spool directory until stopped.
+
+    The HTCondor security setup done in ``main`` is kept for the life of the
+    process. The collector ad is resolved by the first submission and reused
+    until a submission fails, so a job only costs its token requests. A job
+    is a file named ``NAME.job`` listing hostnames in the --hosts-file format.
+    It is renamed to ``NAME.job.active`` while its hosts are registered and
+    ``NAME.status`` is rewritten with each host's status, request ID, approval
+    URL and token path as they change. Jobs still active when the agent stops
+    are picked up again when it restarts; hosts their status file already shows
+    as approved or failed are not requested again.
+
+    Approvals that arrive within ``reconfig_delay`` seconds of the first one are
+    picked up by a single reconfig.
+    """
+
+    def __init__(
+        self, pool, spool, scopes=None, local_dir=None, retries=NUM_RETRIES,
+        poll_interval=POLL_INTERVAL, reconfig_delay=RECONFIG_DELAY,
+    ):
+        self.pool = pool
+        self.spool = spool
+        self.scopes = scopes or DEFAULT_TOKEN_SCOPES
+        self.local_dir = local_dir
+        self.retries = retries
+        self.poll_interval = poll_interval
+        self.reconfig_delay = reconfig_delay
+
+        self.jobs = {}  # job name -> {resource: result, as returned by request_tokens}
+        self.submissions = {}  # future from submit_token_request -> (job name, resource)
+        self.pending = {}  # (job name, resource) -> TokenRequest awaiting approval
+        self.changed = set()  # job names whose status file is out of date
+        self.reconfig_at = None
+        self.stopping = False
+
+        os.makedirs(spool, exist_ok=True)
+        htcondor.param["SEC_TOKEN_DIRECTORY"] = TOKEN_DIRECTORY
+        self.alias = split_pool(pool)[0]
+        self.coll_ad = None  # Resolved in the executor, never on the main loop
+        self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
+
+    def run(self):
+        print("Registration agent is watching {} for jobs.".format(self.spool))
+        self.resume_jobs()
+
+        while not self.stopping:
+            self.step()
+            wait = self.poll_interval
+            if self.reconfig_at is not None:
+                wait = min(wait, max(self.reconfig_at - time.monotonic(), 0))
+            time.sleep(wait)
+
+        self.shutdown()
+
+    def stop(self):
+        self.stopping = True
+
+    def shutdown(self):
+        """Apply any reconfig still owed; unfinished jobs stay active for the next run"""
+        if self.reconfig_at is not None:
+            self.reconfig_at = None
+            reconfig()
+        self.write_statuses()
+        self.executor.shutdown(wait=False)
+        print("Registration agent stopped.")
+
+    def step(self):
+        self.claim_jobs()
+        self.collect_submissions()
+        self.collect_approvals()
+        self.write_statuses()
+        self.finish_jobs()
+
+        if self.reconfig_at is not None and time.monotonic() >= self.reconfig_at:
+            self.reconfig_at = None
+            reconfig()
+
+    def resume_jobs(self):
+        """Pick up the jobs a previous run left active"""
+        for entry in sorted(os.listdir(self.spool)):
+            if entry.endswith(JOB_SUFFIX + ACTIVE_SUFFIX):
+                self.start_job(entry[:-len(JOB_SUFFIX + ACTIVE_SUFFIX)], resume=True)
+
+    def job_path(self, name, suffix=JOB_SUFFIX + ACTIVE_SUFFIX):
+        return os.path.join(self.spool, name + suffix)
+
+    def claim_jobs(self):
+        for entry in sorted(os.listdir(self.spool)):
+            if not entry.endswith(JOB_SUFFIX):
+                continue
+            name = entry[:-len(JOB_SUFFIX)]
+            if name in self.jobs:
+                # Leave a resubmitted job queued until the current one is done
+                continue
+            try:
+                os.replace(os.path.join(self.spool, entry), self.job_path(name))
+            except FileNotFoundError:
+                continue
+            self.start_job(name)
+
+    def read_status(self, name):
+        """Return the results last written to the job's status file, or an empty dict"""
+        try:
+            with open(self.job_path(name, STATUS_SUFFIX)) as f:
+                results = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.exception("Ignoring the unreadable status of registration job {}".format(name))
+            return {}
+        return results if isinstance(results, dict) else {}
+
+    def start_job(self, name, resume=False):
+        previous = self.read_status(name) if resume else {}
+        try:
+            hosts = list(dict.fromkeys(read_hosts_file(self.job_path(name))))
+        except OSError as e:
+            logger.exception("Could not read registration job {}".format(name))
+            hosts = []
+            warning("Could not read registration job {}: {}".format(name, e))
+
+        print("{} registration job {} for {} resource(s).".format("Resuming" if resume else "Starting", name, len(hosts)))
+        results = self.jobs[name] = {}
+        for host in hosts:
+            result = previous.get(host)
+            if isinstance(result, dict) and result.get("status") in ("approved", "failed"):
+                results[host] = result
+                continue
+            if not SOURCE_CHECK.match(host):
+                results[host] = {"status": "failed", "error": "Invalid hostname"}
+                continue
+            results[host] = {"status": "submitting"}
+            self.submissions[self.executor.submit(self.submit, host)] = (name, host)
+        self.changed.add(name)
+
+    def submit(self, resource):
+        """
+        Submit a token request for ``resource`` from the executor, resolving the
+        collector first if no ad is cached. A lookup that fails here is retried
+        by ``submit_token_request`` with backoff instead of stalling the agent.
+        """
+        if self.coll_ad is None:
+            try:
+                _, self.coll_ad = resolve_collector(self.pool)
+            except Exception:
+                logger.exception("Could not resolve the collector {}".format(self.pool))
+        return submit_token_request(self.coll_ad, resource, self.scopes, self.retries, pool=self.pool)
+
+    def collect_submissions(self):
+        for future in [future for future in self.submissions if future.done()]:
+            name, resource = self.submissions.pop(future)
+            try:
+                req, exc = future.result()
+            except Exception as e:
+                logger.exception("Submitting the token request for {} failed".format(resource))
+                req, exc = None, e
+            self.changed.add(name)
+            if req is None:
+                self.jobs[name][resource] = {"status": "failed", "error": "Token request failed: {}".format(exc)}
+                # The next submission looks the collector up again
+                self.coll_ad = None
+                continue
+
+            url = approval_url(req)
+            print("Token request for {} is queued with ID {}: {}".format(resource, req.request_id, url))
+            self.jobs[name][resource] = {"status": "pending", "request_id": req.request_id, "url": url}
+            self.pending[(name, resource)] = req
+
+    def collect_approvals(self):
+        for (name, resource), req in list(self.pending.items()):
+            try:
+                if not req.done():
+                    continue
+                token = req.result(0)
+            except Exception as e:
+                logger.exception("Error while waiting for token approval for {}".format(resource))
+                del self.pending[(name, resource)]
+                self.jobs[name][resource] = {"status": "failed", "request_id": req.request_id, "error": str(e)}
+                self.changed.add(name)
+                continue
+
+            del self.pending[(name, resource)]
+            self.changed.add(name)
+            try:
+                path = write_token(token, self.alias, resource, self.local_dir)
+            except OSError as e:
+                logger.exception("Failed to write the token for {}".format(resource))
+                self.jobs[name][resource] = {"status": "failed", "request_id": req.request_id, "error": str(e)}
+                continue
+
+            print("Token request for {} approved! Token was written to {}".format(resource, path))
+            self.jobs[name][resource] = {"status": "approved", "request_id": req.request_id, "path": path}
+            if self.reconfig_at is None:
+                self.reconfig_at = time.monotonic() + self.reconfig_delay
+
+    def write_statuses(self):
+        for name in self.changed:
+            write_atomically(self.job_path(name, STATUS_SUFFIX), json.dumps(self.jobs[name], indent=2) + "\n")
+        self.changed.clear()
+
+    def finish_jobs(self):
+        for name, results in list(self.jobs.items()):
+            if any(result["status"] not in ("approved", "failed") for result in results.values()):
+                continue
+            approved = sum(result["status"] == "approved" for result in results.values())
+            print("Registration job {} is complete: {} of {} resource(s) registered.".format(name, approved, len(results)))
+            os.remove(self.job_path(name))
+            del self.jobs[name]
 
 
 def is_admin():
@@ -135,16 +471,133 @@ NONROOT_TOKEN_MSG = '''"Registration not run as root; to use token:"
 '''
 
 
-def request_token(pool, resource, scopes=None, local_dir=None):
-    if ":" in pool:
+NONROOT_TOKENS_MSG = '''Registration not run as root; to use the tokens:
+  1. Copy the tokens to the system tokens directory: cp "{dir}"/50-*-registration /etc/condor/tokens.d/
+  2. Ensure the tokens are owned by HTCondor: chown condor: /etc/condor/tokens.d/50-*-registration
+'''
+
+
+# (alias, port) -> (sockaddr to use, time.monotonic() it expires at or None if it won a race)
+_collector_addresses = {}
+_collector_lock = threading.Lock()
+
+
+def split_pool(pool):
+    """Split ``host``, ``host:port``, ``[v6-address]`` or ``[v6-address]:port`` into alias and port"""
+    if pool.startswith("["):
+        alias, _, port = pool[1:].partition("]")
+        port = port.lstrip(":")
+    elif pool.count(":") == 1:
         alias, port = pool.split(":")
     else:
-        alias = pool
-        port = DEFAULT_PORT
-    ip, port = socket.getaddrinfo(alias, int(port), socket.AF_INET)[0][4]
+        alias, port = pool, None
+    return alias, int(port or DEFAULT_PORT)
 
-    if not scopes:
-        scopes = DEFAULT_TOKEN_SCOPES
+
+def collector_addresses(alias, port):
+    """
+    Resolve every IPv4 and IPv6 address of the collector, interleaving the address
+    families starting with the resolver's first choice (RFC 8305)
+    """
+    by_family = {}
+    for family, _, _, _, sockaddr in socket.getaddrinfo(alias, port, socket.AF_UNSPEC, socket.SOCK_STREAM):
+        addresses = by_family.setdefault(family, [])
+        if (family, sockaddr) not in addresses:
+            addresses.append((family, sockaddr))
+
+    ordered = []
+    families = list(by_family.values())
+    while any(families):
+        for addresses in families:
+            if addresses:
+                ordered.append(addresses.pop(0))
+    return ordered
+
+
+def race_connections(addresses, timeout=CONNECT_TIMEOUT, stagger=CONNECT_STAGGER):
+    """
+    Happy eyeballs: start a TCP connection to each address in turn, giving each a
+    ``stagger`` head start (or none, once the previous attempt failed), and return
+    the sockaddr of the first to connect, or ``None`` if none did within ``timeout``
+    """
+    selector = selectors.DefaultSelector()
+    pending = list(addresses)
+    attempts = []
+    deadline = time.monotonic() + timeout
+    next_start = time.monotonic()
+
+    try:
+        while pending or attempts:
+            now = time.monotonic()
+            if now >= deadline:
+                return None
+
+            if pending and (now >= next_start or not attempts):
+                family, sockaddr = pending.pop(0)
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                result = sock.connect_ex(sockaddr)
+                if result in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, 10035):  # 10035: WSAEWOULDBLOCK
+                    logger.debug("Connecting to collector at {}".format(sockaddr))
+                    selector.register(sock, selectors.EVENT_WRITE, sockaddr)
+                    attempts.append(sock)
+                    next_start = now + stagger
+                else:
+                    logger.debug("Connecting to collector at {} failed: {}".format(sockaddr, os.strerror(result)))
+                    sock.close()
+                continue
+
+            wait = (next_start if pending else deadline) - now
+            for key, _ in selector.select(max(min(wait, deadline - now), 0)):
+                sock = key.fileobj
+                selector.unregister(sock)
+                attempts.remove(sock)
+                result = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                sock.close()
+                if result == 0:
+                    logger.debug("Collector at {} won the connection race".format(key.data))
+                    return key.data
+                logger.debug("Connecting to collector at {} failed: {}".format(key.data, os.strerror(result)))
+                next_start = time.monotonic()
+        return None
+    finally:
+        for sock in attempts:
+            sock.close()
+        selector.close()
+
+
+def resolve_collector(pool):
+    """
+    Look up the collector for ``pool`` and return its alias and the ClassAd used
+    to contact it.
+
+    Every resolved address is raced and the fastest to accept a connection is
+    remembered for later calls until ``forget_collector`` is called. If none
+    connects, the first address is used so HTCondor reports the actual error,
+    and that outcome is remembered for RACE_FAILURE_TTL seconds. Races run under
+    a lock, so concurrent callers wait for one race rather than each starting
+    their own. Raises ``OSError`` if the pool's name doesn't resolve.
+    """
+    alias, port = split_pool(pool)
+
+    with _collector_lock:
+        sockaddr, expires = _collector_addresses.get((alias, port), (None, None))
+        if sockaddr is not None and expires is not None and time.monotonic() >= expires:
+            sockaddr = None
+        if sockaddr is None:
+            addresses = collector_addresses(alias, port)
+            logger.debug("Resolved collector {} to {}".format(alias, [address for _, address in addresses]))
+            sockaddr = race_connections(addresses)
+            if sockaddr is None:
+                warning("Could not connect to any address of {}; trying {} anyway.".format(alias, addresses[0][1][0]))
+                sockaddr = addresses[0][1]
+                _collector_addresses[(alias, port)] = (sockaddr, time.monotonic() + RACE_FAILURE_TTL)
+            else:
+                _collector_addresses[(alias, port)] = (sockaddr, None)
+
+    ip, port = sockaddr[:2]
+    if ":" in ip:
+        ip = "[{}]".format(ip)
 
     coll_ad = classad.ClassAd(
         {
@@ -154,15 +607,161 @@ def request_token(pool, resource, scopes=None, local_dir=None):
     )
     logger.debug("Constructed collector ad: {}".format(repr(coll_ad)))
 
-    htcondor.param["SEC_TOKEN_DIRECTORY"] = "/etc/condor/tokens.d"
+    return alias, coll_ad
+
+
+def forget_collector(pool):
+    """
+    Make the next ``resolve_collector`` call race the collector's addresses again.
+    A race that no address won is kept until it expires.
+    """
+    with _collector_lock:
+        key = split_pool(pool)
+        if _collector_addresses.get(key, (None, None))[1] is None:
+            _collector_addresses.pop(key, None)
+
+
+def backoff_delay(attempt, base=RETRY_DELAY, cap=MAX_RETRY_DELAY):
+    """
+    Seconds to wait after failed attempt number ``attempt``: exponential from
+    ``base`` up to ``cap``, with half of it jittered so retries don't synchronise
+    """
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def request_token(pool, resource, scopes=None, local_dir=None):
+    alias, coll_ad = resolve_collector(pool)
+
+    if not scopes:
+        scopes = DEFAULT_TOKEN_SCOPES
+
+    htcondor.param["SEC_TOKEN_DIRECTORY"] = TOKEN_DIRECTORY
 
-    token = request_token_and_wait_for_approval(resource, alias, coll_ad, scopes)
+    token = request_token_and_wait_for_approval(resource, alias, coll_ad, scopes, pool=pool)
 
     if token is None:
         return False
 
     print("Token request approved!")
 
+    msg_path = write_token(token, alias, resource, local_dir)
+    print("Token was written to {}".format(msg_path))
+    if not is_admin():
+        print(NONROOT_TOKEN_MSG.format(path=msg_path, name=os.path.basename(msg_path)))
+
+    return True
+
+
+def request_tokens(pool, resources, scopes=None, local_dir=None, retries=NUM_RETRIES, poll_interval=POLL_INTERVAL):
+    """
+    Request tokens for several resources at once and write each token as soon as
+    its request is approved.
+
+    The collector is resolved once, the requests are submitted concurrently and
+    every pending request is polled on each pass, so approvals can arrive in any
+    order. A collector that fails to resolve is retried per request, like any
+    other failed submission.
+
+    Returns
+    -------
+    A dict mapping each resource, in order, to a dict with its ``status``
+    ("approved" or "failed") and the ``request_id``, token ``path`` or ``error``.
+    """
+    alias = split_pool(pool)[0]
+    try:
+        _, coll_ad = resolve_collector(pool)
+    except OSError as e:
+        logger.exception("Could not resolve the collector {}".format(pool))
+        warning("Could not resolve the collector {}: {}; retrying for each request.".format(pool, e))
+        coll_ad = None
+
+    if not scopes:
+        scopes = DEFAULT_TOKEN_SCOPES
+
+    htcondor.param["SEC_TOKEN_DIRECTORY"] = TOKEN_DIRECTORY
+
+    def submit(resource):
+        return resource, submit_token_request(coll_ad, resource, scopes, retries, pool=pool)
+
+    results = {resource: None for resource in resources}
+    pending = {}
+    with ThreadPoolExecutor(max_workers=min(len(resources), MAX_CONCURRENT_REQUESTS)) as executor:
+        for resource, (req, exc) in executor.map(submit, resources):
+            if req is None:
+                results[resource] = {"status": "failed", "error": "Token request failed: {}".format(exc)}
+                continue
+            print("Token request for {} is queued with ID {}: {}".format(resource, req.request_id, approval_url(req)))
+            pending[resource] = req
+
+    if pending:
+        print(
+            '\nGo to these URLs in your web browser (copy and paste them into the address bar) and approve the requests by clicking "Approve".'
+        )
+
+    while pending:
+        for resource, req in list(pending.items()):
+            try:
+                if not req.done():
+                    continue
+                token = req.result(0)
+            except Exception as e:
+                logger.exception("Error while waiting for token approval for {}".format(resource))
+                del pending[resource]
+                results[resource] = {"status": "failed", "request_id": req.request_id, "error": str(e)}
+                continue
+
+            del pending[resource]
+            try:
+                path = write_token(token, alias, resource, local_dir)
+            except OSError as e:
+                logger.exception("Failed to write the token for {}".format(resource))
+                results[resource] = {"status": "failed", "request_id": req.request_id, "error": str(e)}
+                continue
+
+            print("Token request for {} approved! Token was written to {}".format(resource, path))
+            results[resource] = {"status": "approved", "request_id": req.request_id, "path": path}
+
+        if pending:
+            time.sleep(poll_interval)
+
+    return results
+
+
+def submit_token_request(collector_ad, resource, scopes, retries=NUM_RETRIES, retry_delay=RETRY_DELAY, pool=None):
+    """
+    Submit a token request, retrying failed submissions with backoff (and, if
+    ``pool`` is given, against a freshly raced collector address). A
+    ``collector_ad`` of ``None`` resolves ``pool`` first. Failing to resolve the
+    collector counts as a failed attempt. Returns the request and ``None``, or
+    ``None`` and the last error if every attempt failed.
+    """
+    exc = None
+    for attempt in range(1, retries + 1):
+        if attempt > 1:
+            time.sleep(backoff_delay(attempt - 1, retry_delay))
+        try:
+            if pool is not None and (collector_ad is None or attempt > 1):
+                _, collector_ad = resolve_collector(pool)
+            return make_token_request(collector_ad, resource, scopes), None
+        except Exception as e:
+            logger.exception("Token request for {} failed (attempt {}/{})".format(resource, attempt, retries))
+            exc = e
+            if pool is not None:
+                forget_collector(pool)
+    return None, exc
+
+
+def approval_url(req):
+    # TODO: the url construction here is very manual; use urllib instead
+    return "https://{}/{}?code={}".format(WEBAPP_HOST, REGISTRATION_CODE_PATH, req.request_id)
+
+
+def write_token(token, alias, resource, local_dir=None):
+    """
+    Write ``token`` into SEC_TOKEN_DIRECTORY, owned by HTCondor, and return the
+    path to show the user
+    """
     token_dir = htcondor.param["SEC_TOKEN_DIRECTORY"]
     token_name = "50-{}-{}-registration".format(alias, resource)
     token_path = os.path.join(token_dir, token_name)
@@ -176,22 +775,50 @@ def request_token(pool, resource, scopes=None, local_dir=None):
     else:
         msg_path = token_path
 
+    # Write and chown a hidden temporary file, which HTCondor ignores, then
+    # rename it over the token so a reconfig never sees a partial file
+    temp_name = ".{}.tmp".format(token_name)
+    temp_path = os.path.join(token_dir, temp_name)
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+
     logger.debug("Writing token to disk (in {})".format(msg_path))
-    token.write(token_name)
+    try:
+        token.write(temp_name)
+
+        logger.debug("Correcting token file permissions...")
+        os.chmod(temp_path, 0o600)
+        shutil.chown(temp_path, user=TOKEN_OWNER_USER, group=TOKEN_OWNER_GROUP)
+        logger.debug("Corrected token file permissions...")
+
+        os.replace(temp_path, token_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
     logger.debug("Wrote token to disk (at {})".format(msg_path))
 
-    logger.debug("Correcting token file permissions...")
-    shutil.chown(token_path, user=TOKEN_OWNER_USER, group=TOKEN_OWNER_GROUP)
-    logger.debug("Corrected token file permissions...")
-    print("Token was written to {}".format(msg_path))
-    if not is_admin():
-        print(NONROOT_TOKEN_MSG.format(path=msg_path, name=token_name))
+    return msg_path
 
-    return True
+
+def write_atomically(path, text):
+    """Replace the file at ``path`` with ``text`` so readers see the old or the new contents, never a mix"""
+    directory, name = os.path.split(path)
+    with tempfile.NamedTemporaryFile("w", dir=directory, prefix=".{}.".format(name), delete=False) as f:
+        f.write(text)
+    try:
+        os.replace(f.name, path)
+    except BaseException:
+        os.remove(f.name)
+        raise
 
 
 def request_token_and_wait_for_approval(
-    resource, alias, collector_ad, scopes=None, retries=10, retry_delay=5
+    resource, alias, collector_ad, scopes=None, retries=NUM_RETRIES, retry_delay=RETRY_DELAY, pool=None
 ):
     """
     This function requests a token and waits for the request to be authorized.
@@ -208,6 +835,10 @@ def request_token_and_wait_for_approval(
         The ClassAd used to contact the collector to make the token request to.
     retries
         The number of times to attempt the token authorization flow.
+    retry_delay
+        The base of the jittered exponential backoff between attempts, in seconds.
+    pool
+        If given, the collector's addresses are raced again after a failed attempt.
 
     Returns
     -------
@@ -220,7 +851,7 @@ def request_token_and_wait_for_approval(
     for attempt in range(1, retries + 1):
         if start_time is not None:
             elapsed_time = time.time() - start_time
-            wait_time = retry_delay - elapsed_time
+            wait_time = backoff_delay(attempt - 1, retry_delay) - elapsed_time
             if wait_time > 0:
                 print(
                     "Waiting for ~{:.1f} seconds before retrying...".format(wait_time)
@@ -231,20 +862,21 @@ def request_token_and_wait_for_approval(
 
         print("\nAttempting to get token (attempt {}/{}) ...".format(attempt, retries))
         try:
+            if pool is not None and attempt > 1:
+                alias, collector_ad = resolve_collector(pool)
             req = make_token_request(collector_ad, resource, scopes)
         except Exception as e:
             logger.exception("Token request failed")
             print("Token request failed due to: {}".format(e))
+            if pool is not None:
+                forget_collector(pool)
             continue
 
         try:
-            # TODO: the url construction here is very manual; use urllib instead
             lines = [
                 "Token request is queued with ID {}.".format(req.request_id),
                 'Go to this URL in your web browser (copy and paste it into the address bar) and approve the request by clicking "Approve":',
-                "https://{}/{}?code={}".format(
-                    WEBAPP_HOST, REGISTRATION_CODE_PATH, req.request_id
-                ),
+                approval_url(req),
             ]
             print("\n".join(lines))
             return req.result(0)
@@ -274,11 +906,102 @@ def make_token_request(collector_ad, resource, scopes=None):
     return req
 
 
+def use_collector_security():
+    """Apply COLLECTOR_SECURITY, remembering the local values for ``local_security``"""
+    for key, value in COLLECTOR_SECURITY.items():
+        _local_security.setdefault(key, htcondor.param.get(key))
+        logger.debug('Setting {} to "{}"'.format(key, value))
+        htcondor.param[key] = value
+
+
+def local_security(timeout=MASTER_TIMEOUT):
+    """
+    Returns a SecMan that, while used as a context manager, makes this thread's
+    calls with the local security settings ``use_collector_security`` replaced
+    and gives up establishing a session after ``timeout`` seconds.
+    """
+    sec_man = htcondor.SecMan()
+    for key, value in _local_security.items():
+        # An empty value falls back to HTCondor's default
+        sec_man.setConfig(key, "" if value is None else value)
+    sec_man.setConfig("SEC_TCP_SESSION_TIMEOUT", str(timeout))
+    sec_man.setConfig("SEC_TCP_SESSION_DEADLINE", str(timeout))
+    return sec_man
+
+
 def reconfig():
+    # Talk to the local master through the bindings, with the local security
+    # settings, only falling back to the command line tools if it can't be
+    # reached that way
+    master_ad = locate_master()
+    if master_ad is not None and ping_master(master_ad):
+        if send_reconfig(master_ad):
+            return
     # only do the reconfig if the master is alive
-    if not condor_master_is_alive():
+    elif not condor_master_is_alive():
         return
 
+    run_condor_reconfig()
+
+
+def locate_master():
+    """
+    Returns an ad for the local condor_master built from its address file, or
+    None if HTCondor doesn't know where the master is.
+    """
+    try:
+        address_file = htcondor.param["MASTER_ADDRESS_FILE"]
+    except KeyError:
+        logger.debug("MASTER_ADDRESS_FILE is not set; cannot locate the condor_master in-process")
+        return None
+
+    try:
+        with open(address_file) as f:
+            address = f.readline().strip()
+    except OSError as e:
+        logger.debug("Could not read the condor_master address file {}: {}".format(address_file, e))
+        return None
+
+    if not address:
+        return None
+
+    return classad.ClassAd({"MyAddress": address, "MyType": "Master"})
+
+
+def ping_master(master_ad, timeout=MASTER_TIMEOUT):
+    """
+    Returns True if the condor_master answers a ping within ``timeout`` seconds.
+    A False may only mean the master can't be pinged from here; callers fall back
+    to condor_who.
+    """
+    try:
+        with local_security(timeout) as sec_man:
+            sec_man.ping(master_ad)
+    except Exception as e:
+        logger.debug("Pinging the condor_master at {} failed: {}".format(master_ad["MyAddress"], e))
+        return False
+
+    logger.debug("The condor_master at {} is alive".format(master_ad["MyAddress"]))
+    return True
+
+
+def send_reconfig(master_ad, timeout=MASTER_TIMEOUT):
+    """
+    Returns True if the reconfig command was delivered to the condor_master
+    within ``timeout`` seconds.
+    """
+    logger.debug("Sending a reconfig command to the condor_master to pick up the new token.")
+    try:
+        with local_security(timeout):
+            htcondor.send_command(master_ad, htcondor.DaemonCommands.Reconfig)
+    except Exception as e:
+        logger.debug("Sending a reconfig command to the condor_master failed, falling back to condor_reconfig: {}".format(e))
+        return False
+
+    return True
+
+
+def run_condor_reconfig():
     logger.debug("Running condor_reconfig to pick up the new token.")
 
     cmd = subprocess.run(
@@ -295,7 +1018,8 @@ def reconfig():
 
 def condor_master_is_alive():
     """
-    Returns True if and only if the condor_master is alive.
+    Returns True if and only if the condor_master is alive, according to
+    condor_who. Used when the master can't be pinged in-process.
     May give false negatives (i.e., the master is alive, but we return False),
     since we are very cautious.
     """
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from portal.app import create_app
+from portal.sources import topology_cache
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+CONFIG = {
+    "TESTING": True,
+    "SUPPORT_EMAIL": "support@example.org",
+    "ADMIN_EMAILS": "admin@example.org",
+    "FRESHDESK_API_URL": "http://127.0.0.1:9",
+    "FRESHDESK_API_KEY": "test",
+    "H_CAPTCHA_SITEKEY": "",
+    "H_CAPTCHA_SECRET": "test",
+    "TOPOLOGY_URL": "test://topology",
+    "TOPOLOGY_REFRESH_INTERVAL": 0,
+    "PAGE_CACHE": False,
+}
+
+ADMIN = {"OIDC_CLAIM_email": "admin@example.org", "OIDC_CLAIM_osgid": "OSG1000001"}
+USER = {"OIDC_CLAIM_email": "user@example.org", "OIDC_CLAIM_osgid": "OSG1000002"}
+
+
+@pytest.fixture
+def make_app():
+    """Return a factory for apps built from CONFIG plus the given overrides"""
+
+    def factory(**config):
+        return create_app({**CONFIG, **config})
+
+    yield factory
+    topology_cache.invalidate()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
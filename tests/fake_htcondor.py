@@ -0,0 +1,145 @@
+"""
+Stand-ins for the htcondor and classad bindings, enough to run register.py
+
+``register`` loads a fresh copy of register.py against them for each test. The
+fake collector behind ``htcondor.TokenRequest`` is driven through ``collector``.
+"""
+
+import importlib.util
+import itertools
+import os
+import socket
+import sys
+import threading
+import types
+
+import pytest
+
+REGISTER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "register.py")
+
+
+class FakeCollector:
+    """Token requests the fake collector has seen, and how it answers them"""
+
+    def __init__(self):
+        self.submitted = []  # resource hostnames, in submission order
+        self.fail_submit = set()  # hosts whose submission raises
+        self.deny = set()  # hosts whose request is denied once submitted
+        self.hold = set()  # hosts whose request stays pending
+        self._ids = itertools.count(101)
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            return str(next(self._ids))
+
+
+def make_bindings(collector):
+    htcondor = types.ModuleType("htcondor")
+    classad = types.ModuleType("classad")
+    htcondor.param = {}
+    htcondor.enable_debug = lambda: None
+    htcondor.sent = []  # (address, command) of every send_command
+
+    class Token:
+
+        def __init__(self, identity):
+            self.identity = identity
+
+        def write(self, name):
+            with open(os.path.join(htcondor.param["SEC_TOKEN_DIRECTORY"], name), "w") as f:
+                f.write("token for {}\n".format(self.identity))
+
+    class TokenRequest:
+
+        def __init__(self, identity, bounding_set=None):
+            self.identity = identity
+            self.host = identity.split("-", 1)[1].rsplit("@", 1)[0]
+            self.request_id = None
+
+        def submit(self, collector_ad):
+            assert collector_ad["MyType"] == "Collector"
+            with collector._lock:
+                collector.submitted.append(self.host)
+            if self.host in collector.fail_submit:
+                raise RuntimeError("Failed to submit the token request")
+            self.request_id = collector.next_id()
+
+        def done(self):
+            if self.host in collector.deny:
+                raise RuntimeError("Token request {} was denied".format(self.request_id))
+            return self.host not in collector.hold
+
+        def result(self, timeout):
+            if not self.done():
+                raise RuntimeError("Token request {} is still pending".format(self.request_id))
+            return Token(self.identity)
+
+    class SecMan:
+
+        def __init__(self):
+            self.config = {}
+
+        def setConfig(self, key, value):
+            self.config[key] = value
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def ping(self, ad, command="DC_NOP"):
+            return classad.ClassAd({"AuthorizationSucceeded": True})
+
+    def send_command(ad, command, target=None):
+        htcondor.sent.append((ad["MyAddress"], command))
+
+    htcondor.Token = Token
+    htcondor.TokenRequest = TokenRequest
+    htcondor.SecMan = SecMan
+    htcondor.send_command = send_command
+    htcondor.DaemonCommands = types.SimpleNamespace(Reconfig="Reconfig")
+
+    class ClassAd(dict):
+        pass
+
+    classad.ClassAd = ClassAd
+    return htcondor, classad
+
+
+@pytest.fixture
+def collector():
+    return FakeCollector()
+
+
+@pytest.fixture
+def pool():
+    """A pool address something is listening on, so the collector race has a winner"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(16)
+        yield "127.0.0.1:{}".format(listener.getsockname()[1])
+
+
+@pytest.fixture
+def register(collector, tmp_path, monkeypatch):
+    """A fresh register.py module using the fake bindings, writing tokens under tmp_path"""
+    htcondor, classad = make_bindings(collector)
+    monkeypatch.setitem(sys.modules, "htcondor", htcondor)
+    monkeypatch.setitem(sys.modules, "classad", classad)
+
+    spec = importlib.util.spec_from_file_location("register", REGISTER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    token_dir = tmp_path / "tokens.d"
+    token_dir.mkdir()
+    module.TOKEN_DIRECTORY = str(token_dir)
+    module.TOKEN_OWNER_USER = os.getuid()
+    module.TOKEN_OWNER_GROUP = os.getgid()
+    # Retries and polls don't need to wait in tests
+    module.backoff_delay = lambda attempt, base=None, cap=None: 0
+    module.reconfigs = []
+    module.reconfig = lambda: module.reconfigs.append(True)
+    return module
@@ -0,0 +1,116 @@
+import dataclasses
+import json
+
+import pytest
+
+from portal.api import freshdesk
+from portal.api.models.request import Field, Schema
+from portal.api.models.response import ErrorResponse, OkResponse, encode_response, make_api_response
+
+from .conftest import ADMIN
+
+SCHEMA = Schema(
+    Field("name", str, min_length=1, max_length=5),
+    Field("email", str, pattern=r"^[^@\s]+@[^@\s]+$"),
+    Field("count", int, required=False),
+    Field("tags", list, required=False, max_length=2),
+    Field("captcha", dict, required=False, fields=(Field("value", str, min_length=1),)),
+)
+
+VALID = {"name": "Jane", "email": "jane@example.org"}
+
+
+def codes(errors):
+    return [error["code"] for error in errors]
+
+
+def test_valid_payload_keeps_only_declared_fields():
+    data, errors = SCHEMA.validate({**VALID, "count": 3, "captcha": {"value": "x", "extra": 1}, "admin": True})
+
+    assert errors == []
+    assert data == {**VALID, "count": 3, "captcha": {"value": "x"}}
+
+
+@pytest.mark.parametrize("payload, code, message", [
+    ({"email": "jane@example.org"}, "missing", "name is required"),
+    ({**VALID, "name": 5}, "invalid_type", "name has the wrong type"),
+    ({**VALID, "count": True}, "invalid_type", "count has the wrong type"),
+    ({**VALID, "name": ""}, "too_short", "name must have at least 1 characters"),
+    ({**VALID, "name": "Janet Doe"}, "too_long", "name must have at most 5 characters"),
+    ({**VALID, "tags": ["a", "b", "c"]}, "too_long", "tags must have at most 2 items"),
+    ({**VALID, "email": "not an address"}, "invalid_format", "email is not formatted correctly"),
+    ({**VALID, "captcha": {}}, "missing", "captcha.value is required"),
+])
+def test_invalid_field(payload, code, message):
+    _, errors = SCHEMA.validate(payload)
+
+    assert errors == [{"code": code, "message": message}]
+
+
+def test_every_invalid_field_is_reported():
+    _, errors = SCHEMA.validate({"name": "", "count": "3"})
+
+    assert codes(errors) == ["too_short", "missing", "invalid_type"]
+
+
+def test_body_must_be_an_object():
+    assert SCHEMA.validate(["Jane"]) == ({}, [{"code": "invalid_type", "message": "Request body must be a JSON object"}])
+
+
+@pytest.fixture
+def no_outbound_calls(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("An invalid request was sent on")
+
+    monkeypatch.setattr(freshdesk, "verify_captcha", fail)
+    monkeypatch.setattr(freshdesk.FreshDeskAPI, "_request", fail)
+
+
+@pytest.mark.parametrize("kwargs, code", [
+    ({"data": "not json", "content_type": "application/json"}, "invalid_json"),
+    ({"data": "name=Jane"}, "invalid_json"),
+    ({"json": []}, "invalid_type"),
+    ({"json": {"name": "Jane", "email": "jane@example.org", "description": "Hi"}}, "missing"),
+])
+def test_invalid_ticket_is_rejected_before_any_outbound_call(client, no_outbound_calls, kwargs, code):
+    response = client.post("/api/v1/freshdesk/ticket", **kwargs)
+
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body["status"] == "error"
+    assert codes(body["error"]) == [code]
+
+
+def test_invalid_bulk_request_is_rejected(client, no_outbound_calls):
+    response = client.post("/api/v1/freshdesk/tickets", json={"tickets": []}, environ_base=ADMIN)
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == [{"code": "too_short", "message": "tickets must have at least 1 items"}]
+
+
+@dataclasses.dataclass
+class Ticket:
+    id: int
+    subject: str
+
+
+def test_nested_dataclasses_are_encoded_compactly():
+    body = OkResponse(status="ok", data={"tickets": [Ticket(1, "Café"), Ticket(2, "Hi")]})
+
+    encoded = encode_response(body)
+
+    assert encoded == '{"status":"ok","data":{"tickets":[{"id":1,"subject":"Café"},{"id":2,"subject":"Hi"}]}}'.encode()
+    assert json.loads(encoded) == dataclasses.asdict(body)
+
+
+def test_response_carries_status_and_content_type():
+    response = make_api_response(ErrorResponse(status="error", error=[{"code": "x", "message": "y"}]), 418)
+
+    assert response.status_code == 418
+    assert response.mimetype == "application/json"
+    assert response.get_json() == {"status": "error", "error": [{"code": "x", "message": "y"}]}
+
+
+def test_unserializable_values_are_refused():
+    with pytest.raises(TypeError, match="Object of type object is not JSON serializable"):
+        encode_response(OkResponse(status="ok", data={"value": object()}))
@@ -0,0 +1,152 @@
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+from portal.api import freshdesk
+
+
+class ScriptedHandler(http.server.BaseHTTPRequestHandler):
+    """Answer each request with the next (status, headers, delay) the server was given"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append(self.command)
+        status, headers, delay = self.server.script.pop(0) if self.server.script else (200, {}, 0)
+        if delay:
+            time.sleep(delay)
+        body = b"{}"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = respond
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.script = []
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(freshdesk, "_session", None)
+    return freshdesk.get_session({"FRESHDESK_RETRIES": 3, "FRESHDESK_RETRY_BACKOFF": 0})
+
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_port}/api/v2/tickets"
+
+
+def test_get_is_retried_on_server_errors(server, session):
+    server.script = [(500, {}, 0), (502, {}, 0)]
+
+    assert session.get(url(server), timeout=5).status_code == 200
+    assert server.requests == ["GET"] * 3
+
+
+def test_post_is_not_retried_on_server_errors(server, session):
+    server.script = [(500, {}, 0)]
+
+    assert session.post(url(server), json={}, timeout=5).status_code == 500
+    assert server.requests == ["POST"]
+
+
+def test_post_is_retried_when_freshdesk_asks_to_retry_after(server, session):
+    server.script = [(429, {"Retry-After": "0"}, 0), (503, {"Retry-After": "0"}, 0)]
+
+    assert session.post(url(server), json={}, timeout=5).status_code == 200
+    assert server.requests == ["POST"] * 3
+
+
+def test_post_is_not_retried_on_503_without_retry_after(server, session):
+    server.script = [(503, {}, 0)]
+
+    assert session.post(url(server), json={}, timeout=5).status_code == 503
+    assert server.requests == ["POST"]
+
+
+def test_post_is_not_resent_after_a_read_timeout(server, session):
+    # Freshdesk may have created the ticket before the response timed out
+    server.script = [(201, {}, 0.5)]
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        session.post(url(server), json={}, timeout=(5, 0.1))
+    time.sleep(0.6)
+    assert server.requests == ["POST"]
+
+
+TICKET = {
+    "h-captcha-response": {"value": "token"},
+    "name": "Jane Doe",
+    "email": "jane@example.org",
+    "description": "Please add my resource",
+}
+
+
+@pytest.fixture
+def ticket_client(make_app, monkeypatch):
+    monkeypatch.setattr(freshdesk, "verify_captcha", lambda response: True)
+    monkeypatch.setattr(freshdesk, "_session", None)
+    return make_app(FRESHDESK_RETRY_BACKOFF=0).test_client()
+
+
+def test_ticket_timeout_is_a_json_504(ticket_client, monkeypatch):
+    def timeout(self, **ticket):
+        raise requests.exceptions.ReadTimeout("Read timed out")
+
+    monkeypatch.setattr(freshdesk.FreshDeskAPI, "create_path_ticket", timeout)
+
+    response = ticket_client.post("/api/v1/freshdesk/ticket", json=TICKET)
+
+    assert response.status_code == 504
+    assert response.get_json()["error"][0]["code"] == "upstream_timeout"
+
+
+def test_unreachable_freshdesk_is_a_json_502(ticket_client):
+    # CONFIG points Freshdesk at the discard port, where nothing listens
+    response = ticket_client.post("/api/v1/freshdesk/ticket", json=TICKET)
+
+    assert response.status_code == 502
+    assert response.get_json() == {"status": "error", "error": [{
+        "code": "upstream_error", "message": "Freshdesk could not be reached, please try again later"
+    }]}
+
+
+def test_rate_limit_is_shared_between_processes(make_app):
+    app = make_app(FRESHDESK_RATE_LIMIT=120, FRESHDESK_PROCESSES=2)
+
+    limiter = freshdesk.get_rate_limiter(app)
+
+    assert limiter.rate == 1  # 60 per minute for each of the two processes
+    assert freshdesk.get_rate_limiter(app) is limiter
+    assert freshdesk.get_rate_limiter(make_app(FRESHDESK_RATE_LIMIT=0)) is None
+
+
+def test_single_tickets_wait_on_the_rate_limiter(ticket_client, monkeypatch):
+    acquired = []
+    limiter = freshdesk.get_rate_limiter(ticket_client.application)
+    monkeypatch.setattr(limiter, "acquire", lambda: acquired.append(True))
+
+    ticket_client.post("/api/v1/freshdesk/ticket", json=TICKET)
+
+    assert acquired == [True]
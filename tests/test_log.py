@@ -0,0 +1,131 @@
+import io
+import json
+import logging
+import sys
+import threading
+
+import pytest
+from flask import request
+
+from portal import log
+from portal.log import JSONFormatter, QueueHandler, SamplingFilter, configure_logging, stop_logging
+
+
+def make_record(name="portal.test", level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord(name, level, "/srv/portal/test.py", 42, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_fields():
+    record = make_record(job_id="abc123")
+    record.created, record.msecs = 1760000000.25, 250
+
+    entry = json.loads(JSONFormatter().format(record))
+
+    assert entry == {
+        "time": "2025-10-09T08:53:20.250Z",
+        "level": "INFO",
+        "logger": "portal.test",
+        "message": "hello world",
+        "module": "test",
+        "line": 42,
+        "process": record.process,
+        "thread": record.threadName,
+        "job_id": "abc123",
+    }
+
+
+def test_json_formatter_includes_the_traceback():
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        record = make_record(level=logging.ERROR, msg="failed", args=())
+        record.exc_info = sys.exc_info()
+
+    entry = json.loads(JSONFormatter().format(record))
+
+    assert entry["exception"].startswith("Traceback")
+    assert "ValueError: broken" in entry["exception"]
+
+
+def test_json_formatter_stringifies_unserialisable_extras():
+    entry = json.loads(JSONFormatter().format(make_record(path=object)))
+
+    assert entry["path"] == str(object)
+
+
+@pytest.mark.parametrize("name, level, rate", [
+    ("portal.api.freshdesk", logging.INFO, 0.25),
+    ("portal.api.freshdesk.session", logging.DEBUG, 0.25),  # Inherits its closest ancestor's rate
+    ("portal.api", logging.INFO, 1.0),
+    ("portal.api.freshdesk", logging.WARNING, 1.0),  # Warnings and errors are never sampled
+    ("quiet", logging.INFO, 0.0),
+])
+def test_sampling_filter_rates(name, level, rate, monkeypatch):
+    sampling = SamplingFilter({"portal.api.freshdesk": 0.25, "quiet": 0.0})
+    draws = iter(i / 100 for i in range(100))
+    monkeypatch.setattr(log.random, "random", lambda: next(draws))
+
+    kept = sum(sampling.filter(make_record(name=name, level=level)) for _ in range(100))
+
+    assert kept == rate * 100
+
+
+def test_queue_handler_renders_the_message_on_the_calling_thread(app):
+    records = []
+
+    class Queue:
+        def put_nowait(self, record):
+            records.append(record)
+
+    handler = QueueHandler(Queue())
+    values = ["before"]
+    with app.test_request_context("/ticket"):
+        handler.handle(make_record(msg="%s %s", args=(request.path, values)))
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError:
+            handler.handle(make_record(level=logging.ERROR, msg="failed", args=(),
+                                       exc_info=sys.exc_info()))
+    values.append("after")
+
+    # Formatted later on another thread, outside the request
+    formatted = []
+    thread = threading.Thread(target=lambda: formatted.extend(JSONFormatter().format(r) for r in records))
+    thread.start()
+    thread.join()
+
+    assert json.loads(formatted[0])["message"] == "/ticket ['before']"
+    assert records[0].args is None
+    assert "RuntimeError: boom" in json.loads(formatted[1])["exception"]
+    assert records[1].exc_info is None
+
+
+@pytest.fixture
+def restore_logging():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield
+    stop_logging()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def test_configure_logging_writes_json_lines(restore_logging):
+    stream = io.StringIO()
+    configure_logging(preset="production", sampling={"portal.noisy": 0.0}, stream=stream)
+
+    logging.getLogger("portal.test").info("kept %d", 1)
+    logging.getLogger("portal.test").debug("below the preset level")
+    logging.getLogger("portal.noisy").info("sampled out")
+    logging.getLogger("portal.noisy").warning("never sampled")
+    stop_logging()
+
+    messages = [json.loads(line)["message"] for line in stream.getvalue().splitlines()]
+    assert messages == ["kept 1", "never sampled"]
+
+
+def test_unknown_preset_is_a_configuration_error(restore_logging):
+    with pytest.raises(log.ConfigurationError):
+        configure_logging(preset="loud")
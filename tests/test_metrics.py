@@ -0,0 +1,21 @@
+import os
+
+from portal.metrics import CACHE_REQUESTS, registry
+
+
+def test_every_series_is_labelled_with_the_pid(client):
+    client.get("/metrics")
+
+    page = client.get("/metrics").get_data(as_text=True)
+    series = [line for line in page.splitlines() if line and not line.startswith("#")]
+
+    assert series
+    assert all(f'pid="{os.getpid()}"' in line for line in series)
+    assert f'portal_requests_total{{pid="{os.getpid()}",endpoint="metrics",method="GET",status="200"}}' in page
+
+
+def test_render_includes_cache_lookups():
+    before = CACHE_REQUESTS.value(("test", "hit"))
+    CACHE_REQUESTS.inc(("test", "hit"))
+
+    assert f'portal_cache_requests_total{{pid="{os.getpid()}",cache="test",result="hit"}} {before + 1}' in registry.render()
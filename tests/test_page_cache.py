@@ -0,0 +1,126 @@
+import gzip
+import types
+
+import pytest
+
+from portal.metrics import CACHE_REQUESTS
+from portal.website import page_cache
+
+from .conftest import USER
+
+
+@pytest.fixture
+def fake_brotli(monkeypatch):
+    """brotli is optional; stand in for it so the br variant is built"""
+    module = types.SimpleNamespace(compress=lambda body, quality: b"br:" + body)
+    monkeypatch.setattr(page_cache, "brotli", module)
+    return module
+
+
+@pytest.fixture
+def cached_client(make_app):
+    return make_app(PAGE_CACHE=True).test_client()
+
+
+def test_identity_when_no_encoding_is_accepted(cached_client):
+    response = cached_client.get("/")
+
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert b"support@example.org" in response.data
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_gzip_variant(cached_client):
+    plain = cached_client.get("/").data
+
+    response = cached_client.get("/", headers={"Accept-Encoding": "gzip, deflate"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(response.data) == plain
+
+
+def test_brotli_preferred_over_gzip(fake_brotli, cached_client):
+    plain = cached_client.get("/").data
+
+    response = cached_client.get("/", headers={"Accept-Encoding": "gzip, br"})
+
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.data == b"br:" + plain
+
+
+def test_brotli_falls_back_to_gzip(fake_brotli, cached_client):
+    response = cached_client.get("/", headers={"Accept-Encoding": "gzip, br;q=0"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_strong_etag_per_encoding(cached_client):
+    plain = cached_client.get("/")
+    gzipped = cached_client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    plain_etag, plain_weak = plain.get_etag()
+    gzip_etag, gzip_weak = gzipped.get_etag()
+    assert not plain_weak and not gzip_weak
+    assert gzip_etag == plain_etag + "-gzip"
+    assert cached_client.get("/").get_etag() == (plain_etag, False)
+
+
+def test_if_none_match_returns_304(cached_client):
+    etag = cached_client.get("/", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+
+    response = cached_client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+def test_if_none_match_for_another_encoding_is_a_full_response(cached_client):
+    etag = cached_client.get("/", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+
+    response = cached_client.get("/", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+
+
+def test_pages_are_rendered_once(cached_client):
+    cached_client.get("/application")
+    hits = CACHE_REQUESTS.value(("page", "hit"))
+    misses = CACHE_REQUESTS.value(("page", "miss"))
+
+    cached_client.get("/application")
+
+    assert CACHE_REQUESTS.value(("page", "hit")) == hits + 1
+    assert CACHE_REQUESTS.value(("page", "miss")) == misses
+
+
+@pytest.mark.parametrize("environ, cookie", [
+    (USER, None),
+    ({}, "session"),
+])
+def test_signed_in_or_session_requests_bypass_the_cache(environ, cookie, cached_client):
+    cached_client.get("/")  # Cached for anonymous requests
+    if cookie is not None:
+        cached_client.set_cookie(cookie, "abc", domain="localhost")
+    lookups = CACHE_REQUESTS.value(("page", "hit")) + CACHE_REQUESTS.value(("page", "miss"))
+
+    response = cached_client.get("/", headers={"Accept-Encoding": "gzip"}, environ_base=environ)
+
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert "ETag" not in response.headers
+    assert b"support@example.org" in response.data
+    assert CACHE_REQUESTS.value(("page", "hit")) + CACHE_REQUESTS.value(("page", "miss")) == lookups
+
+
+def test_disabled_cache_renders_directly(client):
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert "ETag" not in response.headers
@@ -0,0 +1,125 @@
+import argparse
+import os
+import stat
+
+import pytest
+
+from .fake_htcondor import collector, pool, register  # noqa: F401 (fixtures)
+
+HOSTS = ["ap1.example.org", "ap2.example.org", "ap3.example.org"]
+
+
+def args(pool, hosts, local_dir=None):
+    return argparse.Namespace(pool=pool, hosts=hosts, scope=None, local_dir=local_dir)
+
+
+def token_path(register, host):
+    return os.path.join(register.TOKEN_DIRECTORY, "50-127.0.0.1-{}-registration".format(host))
+
+
+def test_request_tokens_isolates_failures_per_host(register, collector, pool):
+    collector.fail_submit.add("ap1.example.org")
+    collector.deny.add("ap3.example.org")
+
+    results = register.request_tokens(pool, HOSTS, retries=2, poll_interval=0)
+
+    assert list(results) == HOSTS
+    assert results["ap1.example.org"]["status"] == "failed"
+    assert "Failed to submit" in results["ap1.example.org"]["error"]
+    assert results["ap2.example.org"] == {
+        "status": "approved", "request_id": results["ap2.example.org"]["request_id"],
+        "path": token_path(register, "ap2.example.org")
+    }
+    assert results["ap3.example.org"]["status"] == "failed"
+    assert "denied" in results["ap3.example.org"]["error"]
+    # The failing host was retried; the others were submitted once
+    assert sorted(collector.submitted) == ["ap1.example.org"] * 2 + ["ap2.example.org", "ap3.example.org"]
+    assert sorted(os.listdir(register.TOKEN_DIRECTORY)) == ["50-127.0.0.1-ap2.example.org-registration"]
+
+
+def test_request_tokens_survives_an_unresolvable_collector(register, collector):
+    results = register.request_tokens("no-such-host.invalid:9618", HOSTS[:1], retries=2, poll_interval=0)
+
+    assert results["ap1.example.org"]["status"] == "failed"
+    assert collector.submitted == []
+
+
+def test_register_hosts_reconfigures_once(register, collector, pool, capsys):
+    register.register_hosts(args(pool, HOSTS))
+
+    assert register.reconfigs == [True]
+    out = capsys.readouterr().out
+    assert "Registration of 3 resources is complete!" in out
+    for host in HOSTS:
+        assert os.path.exists(token_path(register, host))
+
+
+def test_register_hosts_exits_nonzero_when_a_host_fails(register, collector, pool, capsys):
+    collector.deny.add("ap2.example.org")
+
+    with pytest.raises(SystemExit) as exit_info:
+        register.register_hosts(args(pool, HOSTS))
+
+    assert exit_info.value.code == 1
+    captured = capsys.readouterr()
+    assert "Failed to register 1 of 3 resources." in captured.err
+    assert "ap2.example.org  failed" in captured.out
+    # The hosts that were approved still get picked up
+    assert register.reconfigs == [True]
+
+
+def test_register_hosts_skips_the_reconfig_when_nothing_was_approved(register, collector, pool, capsys):
+    collector.deny.update(HOSTS)
+
+    with pytest.raises(SystemExit):
+        register.register_hosts(args(pool, HOSTS))
+
+    assert register.reconfigs == []
+
+
+def test_write_token_replaces_the_token_atomically(register, pool):
+    path = token_path(register, "ap1.example.org")
+    with open(path, "w") as f:
+        f.write("old token\n")
+    register.htcondor.param["SEC_TOKEN_DIRECTORY"] = register.TOKEN_DIRECTORY
+
+    returned = register.write_token(register.htcondor.Token("new"), "127.0.0.1", "ap1.example.org")
+
+    assert returned == path
+    with open(path) as f:
+        assert f.read() == "token for new\n"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert os.stat(path).st_uid == os.getuid()
+    # Only the token; the hidden temporary file is gone
+    assert os.listdir(register.TOKEN_DIRECTORY) == [os.path.basename(path)]
+
+
+def test_failed_token_write_keeps_the_old_token(register, pool):
+    path = token_path(register, "ap1.example.org")
+    with open(path, "w") as f:
+        f.write("old token\n")
+    register.htcondor.param["SEC_TOKEN_DIRECTORY"] = register.TOKEN_DIRECTORY
+
+    class BrokenToken:
+        def write(self, name):
+            with open(os.path.join(register.TOKEN_DIRECTORY, name), "w") as f:
+                f.write("partial")
+            raise OSError("No space left on device")
+
+    with pytest.raises(OSError):
+        register.write_token(BrokenToken(), "127.0.0.1", "ap1.example.org")
+
+    with open(path) as f:
+        assert f.read() == "old token\n"
+    assert os.listdir(register.TOKEN_DIRECTORY) == [os.path.basename(path)]
+
+
+def test_write_token_reports_the_host_path_for_local_dir(register, pool):
+    register.htcondor.param["SEC_TOKEN_DIRECTORY"] = register.TOKEN_DIRECTORY
+
+    returned = register.write_token(
+        register.htcondor.Token("new"), "127.0.0.1", "ap1.example.org", local_dir="/home/me/tokens"
+    )
+
+    assert returned == "/home/me/tokens/50-127.0.0.1-ap1.example.org-registration"
+    assert os.path.exists(token_path(register, "ap1.example.org"))
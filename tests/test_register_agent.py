@@ -0,0 +1,157 @@
+import json
+import os
+import time
+
+import pytest
+
+from .fake_htcondor import collector, pool, register  # noqa: F401 (fixtures)
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return tmp_path / "spool"
+
+
+@pytest.fixture
+def make_agent(register, pool, spool):
+    agents = []
+
+    def factory(**kwargs):
+        kwargs.setdefault("poll_interval", 0)
+        kwargs.setdefault("reconfig_delay", 0)
+        agent = register.RegistrationAgent(pool=pool, spool=str(spool), retries=2, **kwargs)
+        agents.append(agent)
+        return agent
+
+    yield factory
+    for agent in agents:
+        agent.executor.shutdown(wait=True)
+
+
+def add_job(spool, name, *hosts, suffix=".job"):
+    spool.mkdir(exist_ok=True)
+    (spool / (name + suffix)).write_text("".join(host + "\n" for host in hosts))
+
+
+def status(spool, name):
+    return json.loads((spool / (name + ".status")).read_text())
+
+
+def step_until(agent, condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        agent.step()
+        if condition():
+            return
+        assert time.monotonic() < deadline, "the agent did not get there in time"
+        time.sleep(0.01)
+
+
+def test_job_is_claimed_by_one_agent_only(make_agent, spool):
+    add_job(spool, "batch", "ap1.example.org")
+    first, second = make_agent(), make_agent()
+
+    first.claim_jobs()
+    second.claim_jobs()
+
+    assert list(first.jobs) == ["batch"]
+    assert second.jobs == {}
+    assert sorted(os.listdir(spool)) == ["batch.job.active"]
+
+
+def test_resubmitted_job_waits_for_the_active_one(make_agent, spool, collector):
+    collector.hold.add("ap1.example.org")
+    add_job(spool, "batch", "ap1.example.org")
+    agent = make_agent()
+    step_until(agent, lambda: agent.pending)
+
+    add_job(spool, "batch", "ap2.example.org")
+    agent.step()
+    assert (spool / "batch.job").exists()
+    assert list(agent.jobs["batch"]) == ["ap1.example.org"]
+
+    collector.hold.clear()
+    step_until(agent, lambda: "ap2.example.org" in agent.jobs.get("batch", {}))
+    assert not (spool / "batch.job").exists()
+
+
+def test_job_is_finished_with_a_status_per_host(make_agent, spool, collector, register):
+    collector.fail_submit.add("ap2.example.org")
+    add_job(spool, "batch", "ap1.example.org", "ap2.example.org", "-bad-")
+    agent = make_agent()
+
+    step_until(agent, lambda: not agent.jobs)
+
+    results = status(spool, "batch")
+    assert results["ap1.example.org"]["status"] == "approved"
+    assert results["ap1.example.org"]["path"].endswith("50-127.0.0.1-ap1.example.org-registration")
+    assert results["ap2.example.org"]["status"] == "failed"
+    assert results["-bad-"] == {"status": "failed", "error": "Invalid hostname"}
+    assert sorted(os.listdir(spool)) == ["batch.status"]
+    assert register.reconfigs == [True]
+
+
+def test_half_processed_job_is_resumed(make_agent, spool, collector, register):
+    add_job(spool, "batch", "ap1.example.org", "ap2.example.org", "ap3.example.org", suffix=".job.active")
+    (spool / "batch.status").write_text(json.dumps({
+        "ap1.example.org": {"status": "approved", "request_id": "7", "path": "/etc/condor/tokens.d/ap1"},
+        "ap2.example.org": {"status": "failed", "error": "Token request failed"},
+        "ap3.example.org": {"status": "pending", "request_id": "9"},
+    }))
+    agent = make_agent()
+
+    agent.resume_jobs()
+    step_until(agent, lambda: not agent.jobs)
+
+    # Only the host that was still in flight is requested again
+    assert collector.submitted == ["ap3.example.org"]
+    results = status(spool, "batch")
+    assert results["ap1.example.org"] == {"status": "approved", "request_id": "7", "path": "/etc/condor/tokens.d/ap1"}
+    assert results["ap2.example.org"]["status"] == "failed"
+    assert results["ap3.example.org"]["status"] == "approved"
+    assert not (spool / "batch.job.active").exists()
+
+
+def test_unreadable_status_file_resumes_every_host(make_agent, spool, collector):
+    add_job(spool, "batch", "ap1.example.org", suffix=".job.active")
+    (spool / "batch.status").write_text("{not json")
+    agent = make_agent()
+
+    agent.resume_jobs()
+    step_until(agent, lambda: not agent.jobs)
+
+    assert collector.submitted == ["ap1.example.org"]
+
+
+def test_approvals_close_together_share_one_reconfig(make_agent, spool, collector, register):
+    hosts = ["ap{}.example.org".format(i) for i in range(1, 6)]
+    collector.hold.update(hosts[2:])
+    add_job(spool, "batch", *hosts)
+    agent = make_agent(reconfig_delay=0.3)
+
+    step_until(agent, lambda: agent.reconfig_at is not None)
+    # The rest are approved before the delay is up
+    collector.hold.clear()
+    step_until(agent, lambda: not agent.jobs)
+    assert register.reconfigs == []
+
+    step_until(agent, lambda: agent.reconfig_at is None)
+    assert register.reconfigs == [True]
+
+    # A later approval gets a reconfig of its own
+    add_job(spool, "later", "ap6.example.org")
+    step_until(agent, lambda: not agent.jobs and agent.reconfig_at is None)
+    assert register.reconfigs == [True, True]
+
+
+def test_shutdown_keeps_unfinished_jobs_and_applies_an_owed_reconfig(make_agent, spool, collector, register):
+    collector.hold.add("ap2.example.org")
+    add_job(spool, "batch", "ap1.example.org", "ap2.example.org")
+    agent = make_agent(reconfig_delay=60)
+    step_until(agent, lambda: agent.reconfig_at is not None)
+
+    agent.shutdown()
+
+    assert register.reconfigs == [True]
+    assert (spool / "batch.job.active").exists()
+    assert status(spool, "batch")["ap2.example.org"]["status"] == "pending"
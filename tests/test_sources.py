@@ -0,0 +1,25 @@
+from portal.sources import UserInfo
+
+
+def test_user_info_is_keyed_on_idp_and_id():
+    user = UserInfo("CILogon", "OSG1000001", "Jane Doe", "jane@example.org")
+    renamed = UserInfo("CILogon", "OSG1000001", "Jane Smith", "jane.smith@example.org")
+
+    assert user.key == ("CILogon", "OSG1000001")
+    assert user == renamed
+    assert {user: 1}[renamed] == 1
+    assert user != UserInfo("Google", "OSG1000001", "Jane Doe", "jane@example.org")
+
+
+def test_user_info_round_trips_through_dict():
+    user = UserInfo.from_environ({
+        "OIDC_CLAIM_idp_name": "CILogon",
+        "OIDC_CLAIM_osgid": "OSG1000001",
+        "OIDC_CLAIM_name": "Jane Doe",
+        "OIDC_CLAIM_email": "jane@example.org",
+    })
+
+    assert user.to_dict() == {"idp": "CILogon", "id": "OSG1000001", "name": "Jane Doe", "email": "jane@example.org"}
+    assert UserInfo.from_dict(user.to_dict()).email == "jane@example.org"
+    assert user["name"] == "Jane Doe"
+    assert user.get("missing", "default") == "default"
@@ -0,0 +1,215 @@
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from portal.api import freshdesk, ticket_queue
+from portal.api.ticket_queue import (
+    FAILED, LEASE_TIMEOUT, QUEUED, SENDING, SENT, UNKNOWN, TicketQueue, start_ticket_queue
+)
+
+PAYLOAD = {"name": "Jane Doe", "email": "jane@example.org", "description": "Please add my resource"}
+
+
+def refused():
+    """What requests raises when the connection to Freshdesk can't be made"""
+    return requests.ConnectionError(MaxRetryError(None, "/api/v2/tickets", NewConnectionError(None, "Connection refused")))
+
+
+def reset():
+    """What requests raises when the connection drops after the ticket was sent"""
+    return requests.ConnectionError(ProtocolError("Connection aborted.", ConnectionResetError("reset by peer")))
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, text="{}"):
+        self.status_code = status_code
+        self.text = text
+        self.ok = status_code < 400
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    """Responses (or exceptions) create_path_ticket gives, in order"""
+    responses = []
+
+    def create_path_ticket(self, **payload):
+        assert payload == PAYLOAD
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(ticket_queue.FreshDeskAPI, "create_path_ticket", create_path_ticket)
+    return responses
+
+
+@pytest.fixture
+def queue(app, tmp_path):
+    return TicketQueue(app, str(tmp_path / "queue" / "tickets.db"), max_attempts=3, retry_delay=10)
+
+
+def column(queue, job_id, name):
+    return queue._connection().execute(f"SELECT {name} FROM tickets WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+def test_not_started_under_test(make_app, tmp_path):
+    app = make_app(FRESHDESK_TICKET_QUEUE=str(tmp_path / "tickets.db"))
+
+    assert start_ticket_queue(app) is None
+    assert "ticket_queue" not in app.extensions
+
+
+def test_sends_queued_ticket(queue, responses):
+    responses.append(FakeResponse(201, '{"id": 7}'))
+    job_id = queue.submit(PAYLOAD)
+
+    queue._send(queue._claim())
+
+    status = queue.status(job_id)
+    assert status["status"] == SENT
+    assert status["attempts"] == 1
+    assert status["ticket"] == {"id": 7}
+    assert queue._claim() is None
+
+
+def test_claimed_job_is_not_claimed_twice(queue):
+    job_id = queue.submit(PAYLOAD)
+
+    assert queue._claim()["id"] == job_id
+    assert queue._claim() is None
+    assert column(queue, job_id, "status") == SENDING
+
+
+def test_expired_lease_is_left_for_reconciliation(queue, caplog):
+    job_id = queue.submit(PAYLOAD)
+    queue._claim()
+
+    # The worker that claimed the job died mid-send, so the ticket may already exist
+    queue._connection().execute(
+        "UPDATE tickets SET updated = ? WHERE id = ?", (time.time() - LEASE_TIMEOUT - 1, job_id)
+    )
+    other = TicketQueue(queue.app, queue.path)
+
+    assert other._claim() is None
+    status = other.status(job_id)
+    assert status["status"] == UNKNOWN
+    assert status["attempts"] == 1
+    assert "manual reconciliation" in caplog.text
+
+
+def test_failures_back_off_exponentially(queue, responses):
+    responses += [FakeResponse(503), refused()]
+    job_id = queue.submit(PAYLOAD)
+
+    for attempt, delay in [(1, 10), (2, 20)]:
+        before = time.time()
+        queue._send(queue._claim())
+
+        assert column(queue, job_id, "status") == QUEUED
+        assert column(queue, job_id, "attempts") == attempt
+        assert before + delay <= column(queue, job_id, "next_attempt") <= time.time() + delay
+        # Not due yet
+        assert queue._claim() is None
+        queue._connection().execute("UPDATE tickets SET next_attempt = 0 WHERE id = ?", (job_id,))
+
+    assert "Connection refused" in queue.status(job_id)["error"]
+
+
+def test_gives_up_after_max_attempts(queue, responses):
+    responses += [FakeResponse(503)] * 3
+    job_id = queue.submit(PAYLOAD)
+
+    for _ in range(3):
+        queue._send(queue._claim())
+        queue._connection().execute("UPDATE tickets SET next_attempt = 0 WHERE id = ?", (job_id,))
+
+    status = queue.status(job_id)
+    assert status["status"] == FAILED
+    assert status["attempts"] == 3
+    assert queue._claim() is None
+
+
+def test_rejected_ticket_is_not_retried(queue, responses):
+    responses.append(FakeResponse(400, '{"description": "Validation failed"}'))
+    job_id = queue.submit(PAYLOAD)
+
+    queue._send(queue._claim())
+
+    status = queue.status(job_id)
+    assert status["status"] == FAILED
+    assert status["response_code"] == 400
+    assert "Validation failed" in status["error"]
+
+
+@pytest.mark.parametrize("response", [
+    requests.ReadTimeout("Read timed out"),
+    reset(),
+    FakeResponse(500),
+    FakeResponse(504),
+], ids=["read timeout", "reset after sending", "500", "504"])
+def test_ticket_that_may_exist_is_not_resent(queue, responses, response):
+    responses.append(response)
+    job_id = queue.submit(PAYLOAD)
+
+    queue._send(queue._claim())
+
+    assert queue.status(job_id)["status"] == UNKNOWN
+    assert queue._claim() is None
+
+
+class SlowFreshdesk(http.server.BaseHTTPRequestHandler):
+    """Accept tickets but answer too late"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.posts += 1
+        time.sleep(0.5)
+        self.send_response(201)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+
+def test_read_timeout_does_not_resend_the_ticket(make_app, tmp_path, monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlowFreshdesk)
+    server.daemon_threads = True
+    server.posts = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(freshdesk, "_session", None)
+    app = make_app(
+        FRESHDESK_API_URL=f"http://127.0.0.1:{server.server_port}",
+        FRESHDESK_READ_TIMEOUT=0.1,
+        FRESHDESK_RETRY_BACKOFF=0
+    )
+    queue = TicketQueue(app, str(tmp_path / "tickets.db"), retry_delay=0)
+    try:
+        job_id = queue.submit(PAYLOAD)
+
+        queue._send(queue._claim())
+        time.sleep(0.6)
+
+        assert queue.status(job_id)["status"] == UNKNOWN
+        assert queue._claim() is None
+        assert server.posts == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_refused_connection_is_retried(make_app, tmp_path, monkeypatch):
+    # CONFIG points Freshdesk at the discard port, where nothing listens
+    monkeypatch.setattr(freshdesk, "_session", None)
+    queue = TicketQueue(make_app(FRESHDESK_RETRY_BACKOFF=0), str(tmp_path / "tickets.db"))
+    job_id = queue.submit(PAYLOAD)
+
+    queue._send(queue._claim())
+
+    assert queue.status(job_id)["status"] == QUEUED
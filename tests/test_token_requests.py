@@ -0,0 +1,176 @@
+import json
+import os
+import re
+import time
+
+import pytest
+
+from portal.token_requests import get_token_request_cache
+
+from .conftest import ADMIN, FIXTURES, USER
+
+
+def token_request(request_id):
+    return {
+        "RequestId": request_id,
+        "ClientId": f"client-{request_id}",
+        "PeerLocation": "192.0.2.1",
+        "RequestedIdentity": f"RESOURCE-host{request_id}.example.org@cm-1.ospool.osg-htc.org",
+        "AuthenticatedIdentity": "anonymous@ssl",
+        "LimitAuthorization": "READ,ADVERTISE_MASTER",
+    }
+
+
+class Collector:
+    """The pending requests and call log of the stand-in condor_token_request_* tools"""
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def set(self, *request_ids):
+        with open(self.path, "w") as f:
+            json.dump([token_request(request_id) for request_id in request_ids], f)
+
+    def pending(self):
+        with open(self.path) as f:
+            return [request["RequestId"] for request in json.load(f)]
+
+    def calls(self):
+        try:
+            with open(self.path + ".calls") as f:
+                return [line.split() for line in f]
+        except FileNotFoundError:
+            return []
+
+
+@pytest.fixture
+def collector(tmp_path, monkeypatch):
+    collector = Collector(tmp_path / "requests.json")
+    collector.set("101", "102")
+    monkeypatch.setenv("CONDOR_STANDIN_STATE", collector.path)
+    return collector
+
+
+@pytest.fixture
+def client(make_app, collector):
+    app = make_app(COLLECTOR="cm.example.org", CONDOR_BIN_DIR=os.path.join(FIXTURES, "condor"))
+    return app.test_client()
+
+
+def checkboxes(response):
+    """Request ID -> whether its checkbox is ticked, in page order"""
+    return {
+        request_id: bool(checked)
+        for request_id, checked in re.findall(r'name="request_id"\s+id="[^"]*" value="([^"]*)"\s*(checked)?',
+                                               response.get_data(as_text=True))
+    }
+
+
+def get(client, path, **kwargs):
+    return client.get(path, environ_base=ADMIN, **kwargs)
+
+
+def post(client, path, request_ids, **kwargs):
+    return client.post(path, data={"request_id": request_ids}, environ_base=ADMIN, **kwargs)
+
+
+def test_requires_admin(client):
+    response = client.get("/token")
+    assert response.status_code == 401
+    assert response.get_json() == {"status": "error", "error": [
+        {"code": "unauthenticated", "message": "You must be logged in"}
+    ]}
+
+    response = client.get("/token", environ_base=USER)
+    assert response.status_code == 403
+    assert response.get_json()["error"][0]["code"] == "forbidden"
+
+
+def test_lists_pending_requests_and_preselects_code(client, collector):
+    response = get(client, "/token?code=102")
+
+    assert response.status_code == 200
+    assert checkboxes(response) == {"101": False, "102": True}
+    assert "RESOURCE-host101.example.org@cm-1.ospool.osg-htc.org" in response.get_data(as_text=True)
+    assert collector.calls() == [["list", "-pool", "cm.example.org", "-json"]]
+
+
+def test_listing_is_cached(client, collector):
+    get(client, "/token")
+    get(client, "/token")
+
+    assert len(collector.calls()) == 1
+
+
+def test_code_missing_from_listing_is_looked_up(client, collector):
+    get(client, "/token")
+    collector.set("101", "102", "103")
+
+    response = get(client, "/token?code=103")
+
+    assert checkboxes(response) == {"103": True, "101": False, "102": False}
+    assert collector.calls()[-1] == ["list", "-pool", "cm.example.org", "-reqid", "103", "-json"]
+
+
+def test_stale_listing_is_refreshed_in_the_background(client, collector):
+    cache = get_token_request_cache(client.application)
+    cache.ttl = 0
+    get(client, "/token")
+    collector.set("102", "104")
+
+    # The stale listing is served while the refresh runs
+    assert "101" in checkboxes(get(client, "/token"))
+    for _ in range(100):
+        if not cache._refreshing:
+            break
+        time.sleep(0.05)
+
+    cache.ttl = 60
+    ids = [request["request_id"] for request in cache.pending()]
+    assert sorted(ids) == ["102", "104"]
+
+
+def test_approves_several_requests(client, collector):
+    collector.set("101", "102", "103")
+    get(client, "/token")
+
+    response = post(client, "/token", ["101", "103"])
+
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert "Approved request 101" in page
+    assert "Approved request 103" in page
+    assert collector.pending() == ["102"]
+    # Approved requests leave the cached listing without another listing call
+    assert checkboxes(response) == {"102": False}
+    assert [call[0] for call in collector.calls()].count("list") == 1
+
+
+def test_invalid_and_unknown_request_ids(client, collector):
+    page = post(client, "/token", ["not-a-number", "999"]).get_data(as_text=True)
+
+    assert "Could not approve request not-a-number: Invalid request ID" in page
+    assert "Could not approve request 999" in page
+    assert "does not exist" in page
+    assert not any(call[0] == "approve" and "not-a-number" in call for call in collector.calls())
+    assert collector.pending() == ["101", "102"]
+
+
+def test_cross_origin_post_is_refused(client, collector):
+    response = post(client, "/token", ["101"], headers={"Origin": "https://evil.example.org"})
+
+    assert response.status_code == 403
+    assert collector.pending() == ["101", "102"]
+
+    response = post(client, "/token", ["101"], headers={"Origin": "http://localhost"})
+    assert response.status_code == 200
+    assert collector.pending() == ["102"]
+
+
+def test_collector_failure(make_app, collector, tmp_path):
+    app = make_app(COLLECTOR="cm.example.org", CONDOR_BIN_DIR=str(tmp_path / "missing"))
+
+    response = get(app.test_client(), "/token")
+
+    assert response.status_code == 503
+    assert "Could not get the pending token requests" in response.get_data(as_text=True)
@@ -0,0 +1,494 @@
+import http.server
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from portal import sources
+from portal.exceptions import TopologyError
+from portal.metrics import CACHE_REQUESTS, TOPOLOGY_INDEX_DURATION, UPSTREAM_DURATION, UPSTREAM_REQUESTS
+from portal.sources import (
+    SERVICE_MAPPING, TOPOLOGY_URL, TopologyCache, TopologyRefresher, TopologySnapshot, UserInfo, get_access_point_fqdns, get_all_sources,
+    get_execution_endpoint_fqdns, index_topology, load_topology_index, topology_cache, topology_snapshots
+)
+
+from .conftest import CONFIG, FIXTURES
+
+URL = "test://topology"
+RGSUMMARY = os.path.join(FIXTURES, "rgsummary.xml")
+
+INDEX = {
+    "OSG1000001": {"Submit Node": ["ap.example.edu", "ap2.other.edu"], "Execution Endpoint": ["ep.example.edu"]},
+    "OSG1000002": {"Execution Endpoint": ["ep.example.edu"]},
+}
+
+
+class Loader:
+    """Topology loader that counts its calls and can be made to block or fail"""
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, url):
+        assert url == URL
+        self.calls += 1
+        self.release.wait(5)
+        value = self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def cache_lookups(result):
+    return CACHE_REQUESTS.value(("topology", result))
+
+
+def wait_for_refresh(cache):
+    for _ in range(100):
+        if not cache._refreshing:
+            return
+        time.sleep(0.01)
+    raise AssertionError("The background refresh did not finish")
+
+
+def test_fresh_entry_is_served_from_memory():
+    cache = TopologyCache(ttl=60)
+    loader = Loader({"OSG1": {}})
+    misses, hits = cache_lookups("miss"), cache_lookups("hit")
+
+    assert cache.get(URL, loader) == {"OSG1": {}}
+    assert cache.get(URL, loader) == {"OSG1": {}}
+    assert loader.calls == 1
+    assert cache_lookups("miss") == misses + 1
+    assert cache_lookups("hit") == hits + 1
+
+
+def test_expired_entry_is_served_while_it_refreshes():
+    cache = TopologyCache(ttl=60)
+    cache.prime(URL, "old", age=61)
+    loader = Loader("new")
+    loader.release.clear()
+    stale = cache_lookups("stale")
+
+    # The caller does not wait on the refresh, and only one refresh is started
+    assert cache.get(URL, loader) == "old"
+    assert cache.get(URL, loader) == "old"
+    assert cache_lookups("stale") == stale + 2
+
+    loader.release.set()
+    wait_for_refresh(cache)
+    assert loader.calls == 1
+    assert cache.get(URL, loader) == "new"
+    assert cache.age(URL) < 60
+
+
+def test_failed_refresh_keeps_serving_the_stale_entry():
+    cache = TopologyCache(ttl=60)
+    cache.prime(URL, "old", age=61)
+    loader = Loader(TopologyError("Topology is down"))
+
+    assert cache.get(URL, loader) == "old"
+    wait_for_refresh(cache)
+
+    assert cache.peek(URL) == "old"
+    assert cache.age(URL) > 60
+
+
+def test_concurrent_cold_misses_share_one_load():
+    cache = TopologyCache(ttl=60)
+    loader = Loader("value")
+    loader.release.clear()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(URL, loader))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(0.1)
+    loader.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["value"] * 4
+    assert loader.calls == 1
+
+
+def test_failed_cold_load_raises_and_is_retried():
+    cache = TopologyCache(ttl=60)
+    loader = Loader(TopologyError("Topology is down"), "value")
+
+    with pytest.raises(TopologyError):
+        cache.get(URL, loader)
+    assert cache.get(URL, loader) == "value"
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TopologyCache(ttl=60, max_entries=2)
+    cache.prime("a", 1)
+    cache.prime("b", 2)
+    cache.peek("a")
+    cache.prime("c", 3)
+
+    assert cache.peek("b") is None
+    assert (cache.peek("a"), cache.peek("c")) == (1, 3)
+
+
+def test_peek_never_loads_and_counts_stale_entries():
+    cache = TopologyCache(ttl=60)
+    misses, stale = cache_lookups("miss"), cache_lookups("stale")
+
+    assert cache.peek(URL) is None
+    cache.prime(URL, "old", age=61)
+    assert cache.peek(URL) == "old"
+
+    assert cache_lookups("miss") == misses + 1
+    assert cache_lookups("stale") == stale + 1
+
+
+def test_invalidate():
+    cache = TopologyCache(ttl=60)
+    cache.prime("a", 1)
+    cache.prime("b", 2)
+
+    cache.invalidate("a")
+    assert cache.peek("a") is None
+    assert cache.peek("b") == 2
+
+    cache.invalidate()
+    assert cache.age("b") is None
+
+
+def test_index_topology_maps_admin_contacts_to_active_resources():
+    with open(RGSUMMARY, "rb") as f:
+        index = index_topology(f)
+
+    # Inactive resources, resources without an FQDN and non-administrative contacts are left out
+    assert index == INDEX
+
+
+def test_sources_are_looked_up_in_the_index(app):
+    topology_cache.prime(CONFIG["TOPOLOGY_URL"], INDEX)
+    jane = UserInfo(id="OSG1000001")
+
+    with app.test_request_context():
+        assert get_all_sources(jane) == {"Submit Node": ["ap.example.edu", "ap2.other.edu"],
+                                         "Execution Endpoint": ["ep.example.edu"]}
+        assert get_access_point_fqdns(UserInfo(id="OSG1000002")) == []
+        assert get_execution_endpoint_fqdns(UserInfo(id="OSG1000002")) == ["ep.example.edu"]
+        assert get_all_sources(UserInfo(id="OSG9999999")) == {"Submit Node": [], "Execution Endpoint": []}
+        # Users without an OSG ID don't need topology at all
+        topology_cache.invalidate()
+        assert get_all_sources(UserInfo()) == {"Submit Node": [], "Execution Endpoint": []}
+
+        # Callers get copies they may modify
+        topology_cache.prime(CONFIG["TOPOLOGY_URL"], INDEX)
+        get_all_sources(jane)["Submit Node"].append("changed.example.edu")
+        assert INDEX["OSG1000001"]["Submit Node"] == ["ap.example.edu", "ap2.other.edu"]
+
+
+def test_one_query_covers_every_service(make_app, monkeypatch):
+    assert all(f"service_{service_id}=on" in TOPOLOGY_URL for service_id in SERVICE_MAPPING.values())
+
+    urls = []
+    monkeypatch.setattr(sources, "load_topology_index", lambda url, timeout: urls.append(url) or INDEX)
+    app = make_app(TOPOLOGY_URL=TOPOLOGY_URL)
+
+    with app.test_request_context():
+        assert get_access_point_fqdns(UserInfo(id="OSG1000001")) == ["ap.example.edu", "ap2.other.edu"]
+        assert get_execution_endpoint_fqdns(UserInfo(id="OSG1000001")) == ["ep.example.edu"]
+
+    assert urls == [TOPOLOGY_URL]
+
+
+class BrokenStream(io.BytesIO):
+    """A response body whose connection drops after the first chunk"""
+
+    def read(self, size=-1):
+        if self.tell():
+            raise ConnectionResetError("connection reset by peer")
+        return super().read(size)
+
+
+def test_index_topology_reads_in_chunks(monkeypatch):
+    monkeypatch.setattr(sources, "TOPOLOGY_READ_SIZE", 7)
+    with open(RGSUMMARY, "rb") as f:
+        assert index_topology(f) == INDEX
+
+
+@pytest.mark.parametrize("body, message", [
+    (b"", "empty response"),
+    (b"<ResourceSummary><ResourceGroup>", "malformed XML"),
+    (b"<ResourceSummary></ResourceSummary>", "Failed to find any OSG Topology resources"),
+])
+def test_index_topology_rejects_unusable_documents(body, message):
+    with pytest.raises(TopologyError, match=message):
+        index_topology(io.BytesIO(body))
+
+
+def test_index_topology_reports_dropped_connections(monkeypatch):
+    monkeypatch.setattr(sources, "TOPOLOGY_READ_SIZE", 64)
+    with open(RGSUMMARY, "rb") as f:
+        stream = BrokenStream(f.read())
+
+    with pytest.raises(TopologyError, match="Error retrieving"):
+        index_topology(stream)
+
+
+ETAG = '"rgsummary-1"'
+LAST_MODIFIED = "Mon, 05 Oct 2026 12:00:00 GMT"
+
+
+class TopologyHandler(http.server.BaseHTTPRequestHandler):
+    """Serve the rgsummary fixture, answering matching conditional requests with a 304"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.server.status != 200:
+            self.send_error(self.server.status)
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        with open(RGSUMMARY, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def topology_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), TopologyHandler)
+    server.daemon_threads = True
+    server.status = 200
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_port}/rgsummary/xml"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(topology_snapshots, "directory", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(topology_cache, "ttl", 60)
+    return tmp_path / "snapshots"
+
+
+def age_snapshot(url, seconds):
+    snapshot = topology_snapshots.read(url)
+    topology_snapshots.write(url, snapshot._replace(fetched_at=snapshot.fetched_at - seconds))
+
+
+def test_download_is_snapshotted_and_reused(topology_server, snapshot_dir):
+    assert load_topology_index(topology_server.url) == INDEX
+
+    snapshot = topology_snapshots.read(topology_server.url)
+    assert (snapshot.index, snapshot.etag, snapshot.last_modified) == (INDEX, ETAG, LAST_MODIFIED)
+    assert [path.suffix for path in snapshot_dir.iterdir()] == [".json"]
+
+    # Another worker finds the fresh snapshot and doesn't ask Topology again
+    assert load_topology_index(topology_server.url) == INDEX
+    assert len(topology_server.requests) == 1
+
+
+def test_unchanged_topology_costs_a_304(topology_server, snapshot_dir):
+    load_topology_index(topology_server.url)
+    age_snapshot(topology_server.url, 120)
+
+    assert load_topology_index(topology_server.url) == INDEX
+
+    request = topology_server.requests[-1]
+    assert request["If-None-Match"] == ETAG
+    assert request["If-Modified-Since"] == LAST_MODIFIED
+    # The 304 renews the snapshot, so the next worker doesn't ask again
+    assert topology_snapshots.read(topology_server.url).age < 60
+    load_topology_index(topology_server.url)
+    assert len(topology_server.requests) == 2
+
+
+def test_errors_are_not_masked_by_a_snapshot(topology_server, snapshot_dir):
+    topology_server.status = 503
+    with pytest.raises(TopologyError):
+        load_topology_index(topology_server.url)
+
+    topology_server.status = 200
+    load_topology_index(topology_server.url)
+    age_snapshot(topology_server.url, 120)
+    topology_server.status = 500
+    with pytest.raises(TopologyError):
+        load_topology_index(topology_server.url)
+
+
+def observed(histogram, labels=()):
+    """Return the count and sum of a histogram series"""
+    series = histogram._series.get(labels)
+    return (0, 0.0) if series is None else (sum(series[:-1]), series[-1])
+
+
+def test_indexing_is_timed_apart_from_the_upstream_call(topology_server, snapshot_dir, monkeypatch):
+    def slow_index(stream):
+        time.sleep(0.2)
+        return index_topology(stream)
+
+    monkeypatch.setattr(sources, "index_topology", slow_index)
+    upstream_count, upstream_sum = observed(UPSTREAM_DURATION, ("topology",))
+    index_count, index_sum = observed(TOPOLOGY_INDEX_DURATION)
+    ok = UPSTREAM_REQUESTS.value(("topology", "ok"))
+
+    assert load_topology_index(topology_server.url) == INDEX
+
+    assert UPSTREAM_REQUESTS.value(("topology", "ok")) == ok + 1
+    count, total = observed(UPSTREAM_DURATION, ("topology",))
+    assert (count, total - upstream_sum < 0.2) == (upstream_count + 1, True)
+    count, total = observed(TOPOLOGY_INDEX_DURATION)
+    assert (count, total - index_sum >= 0.2) == (index_count + 1, True)
+
+    # A 304 has no body to index
+    age_snapshot(topology_server.url, 120)
+    load_topology_index(topology_server.url)
+    assert observed(TOPOLOGY_INDEX_DURATION)[0] == index_count + 1
+    assert UPSTREAM_REQUESTS.value(("topology", "not_modified")) >= 1
+
+
+def test_snapshot_is_reloaded_after_a_restart(make_app, snapshot_dir):
+    url = "https://topology.example.org/rgsummary/xml"
+    topology_snapshots.write(url, TopologySnapshot(index=INDEX, etag=ETAG, fetched_at=time.time() - 30))
+
+    make_app(TOPOLOGY_URL=url, TOPOLOGY_SNAPSHOT_DIR=str(snapshot_dir), TOPOLOGY_CACHE_TTL=60)
+
+    assert topology_cache.peek(url) == INDEX
+    assert 30 <= topology_cache.age(url) < 60
+
+
+def test_unusable_snapshots_are_ignored(snapshot_dir):
+    url = "https://topology.example.org/rgsummary/xml"
+    topology_snapshots.write(url, TopologySnapshot(index=INDEX))
+    assert topology_snapshots.read(url).index == INDEX
+
+    with open(topology_snapshots.path(url), "w") as f:
+        f.write("{not json")
+    assert topology_snapshots.read(url) is None
+
+    # A file written for another URL, say after a hash collision
+    with open(topology_snapshots.path(url), "w") as f:
+        json.dump({"url": "https://elsewhere.example.org", "index": INDEX}, f)
+    assert topology_snapshots.read(url) is None
+
+
+class Results(list):
+    """What each load_topology_snapshot call returns or raises, in order, and the refresher's state during each call"""
+    refresher = None
+
+    def __init__(self):
+        super().__init__()
+        self.states = []
+
+
+@pytest.fixture
+def topology_results(monkeypatch):
+    results = Results()
+
+    def load(url, timeout):
+        results.states.append(results.refresher.state)
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return TopologySnapshot(index=result, fetched_at=time.time())
+
+    monkeypatch.setattr(sources, "load_topology_snapshot", load)
+    return results
+
+
+@pytest.fixture
+def refresher(topology_results):
+    refresher = TopologyRefresher(TopologyCache(), URL, interval=300, retry_delay=10, max_backoff=30,
+                                  breaker_threshold=2)
+    topology_results.refresher = refresher
+    yield refresher
+    refresher.stop()
+
+
+def test_refresher_backs_off_and_opens_the_breaker(refresher, topology_results):
+    refresher.cache.prime(URL, "last good index")
+    topology_results += [TopologyError("Topology is down")] * 4
+
+    assert [refresher.refresh() for _ in range(4)] == [10, 20, 30, 30]
+    assert refresher.state == TopologyRefresher.OPEN
+    assert refresher.failures == 4
+    assert refresher.last_error == "Topology is down"
+    # Requests are still served the last good data
+    assert refresher.cache.peek(URL) == "last good index"
+    # Every attempt after the breaker opened was a single half-open probe
+    assert topology_results.states == ["closed", "closed", "half-open", "half-open"]
+
+
+def test_successful_probe_closes_the_breaker(refresher, topology_results):
+    topology_results += [TopologyError("Topology is down")] * 2 + [INDEX]
+    refresher.refresh()
+    refresher.refresh()
+    assert refresher.state == TopologyRefresher.OPEN
+
+    assert refresher.refresh() == 300
+
+    status = refresher.status()
+    assert (status["state"], status["failures"], status["last_error"]) == ("closed", 0, None)
+    assert status["snapshot_age"] < 1
+    assert 299 < status["next_attempt_in"] <= 300
+    assert refresher.cache.peek(URL) == INDEX
+
+
+def test_requests_read_what_the_running_refresher_loaded(make_app, topology_results):
+    app = make_app(TOPOLOGY_URL=URL)
+    refresher = TopologyRefresher(topology_cache, URL, interval=300)
+    topology_results.refresher = refresher
+    app.extensions["topology_refresher"] = refresher
+
+    with app.test_request_context():
+        topology_results.append(TopologyError("Topology is down"))
+        refresher.start()
+        try:
+            for _ in range(100):
+                if refresher.failures:
+                    break
+                time.sleep(0.01)
+            # Handlers never load topology themselves while the refresher runs
+            with pytest.raises(TopologyError, match="not been retrieved yet"):
+                get_all_sources(UserInfo(id="OSG1000001"))
+
+            topology_results.append(INDEX)
+            refresher.refresh()
+            assert get_access_point_fqdns(UserInfo(id="OSG1000001")) == ["ap.example.edu", "ap2.other.edu"]
+
+            response = app.test_client().get("/api/v1/topology/status")
+            assert response.status_code == 200
+            assert response.get_json()["data"]["running"] is True
+        finally:
+            refresher.stop()
+
+
+def test_refresher_keeps_the_age_of_another_workers_snapshot(snapshot_dir):
+    url = "https://topology.example.org/rgsummary/xml"
+    topology_snapshots.write(url, TopologySnapshot(index=INDEX, fetched_at=time.time() - 50))
+    refresher = TopologyRefresher(TopologyCache(), url, interval=60)
+
+    refresher.refresh()
+
+    assert refresher.cache.peek(url) == INDEX
+    assert 50 <= refresher.status()["snapshot_age"] < 51
@@ -1,4 +1,3 @@
-from logging.config import dictConfig
 import os
 import sys
 
@@ -8,26 +7,11 @@ logdir = os.path.join(HERE, "logs")
 if not os.path.exists(logdir):
     logdir = "/var/log/condor"
 
-dictConfig(
-    {
-        "version": 1,
-        "formatters": {
-            "default": {
-                "format": "[%(asctime)s] [%(levelname)s] %(module)s:%(lineno)s ~ %(message)s",
-            }
-        },
-        "handlers": {
-            "wsgi": {
-                "class": "logging.StreamHandler",
-                "level": "DEBUG",
-                "formatter": "default",
-                "stream": "ext://flask.logging.wsgi_errors_stream",
-            },
-        },
-        "root": {"level": "DEBUG", "handlers": ["wsgi"]},
-    }
-)
+from portal.log import configure_logging
 
+# Request threads only enqueue records; a listener thread writes them as JSON.
+# PORTAL_LOG_PRESET=development logs everything at DEBUG
+configure_logging()
 
 from portal import create_app
 